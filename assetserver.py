@@ -0,0 +1,229 @@
+# core/assetserver.py
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+ASSET_HOST = "127.0.0.1"
+ASSET_PORT = 8000
+# Zwischengespeicherte Datei-Hashes (Schlüssel: Pfad, Größe, mtime), damit der Start nicht alles neu liest
+MANIFEST_FILE = ".asset-manifest.json"
+# Versionierte URLs (/v/<build-hash>/...) ändern sich mit jedem Build und dürfen ewig gecacht werden
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+_ENCODINGS = {".br": "br", ".gz": "gzip"}
+_MIME_OVERRIDES = {
+    ".wasm": "application/wasm",
+    ".js": "application/javascript",
+    ".data": "application/octet-stream",
+    ".unityweb": "application/octet-stream",
+    ".json": "application/json",
+}
+_VERSIONED = re.compile(r"^/v/([0-9a-f]+)(/.*)$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def content_type(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    return _MIME_OVERRIDES.get(ext) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+class AssetServer:
+    """Statischer Server für den Unity-WebGL-Build im eigenen Prozess.
+
+    Liefert vorkomprimierte .br/.gz-Varianten mit passendem Content-Encoding,
+    Inhalts-Hashes als ETag, Range-Anfragen und lange Cache-Zeiten für versionierte
+    URLs. `ready` wird gesetzt, sobald der Socket lauscht und der Build-Hash feststeht.
+    """
+
+    def __init__(self, root: str, host: str = ASSET_HOST, port: int = ASSET_PORT):
+        self.root = os.path.abspath(root)
+        self.ready = threading.Event()
+        self.build_hash = None
+        self._hashes = {}
+        server = self
+
+        class Handler(_AssetHandler):
+            assets = server
+
+        try:
+            self.httpd = ThreadingHTTPServer((host, port), Handler)
+        except OSError:
+            # Port belegt (z. B. zweite Instanz): freien Port nehmen
+            self.httpd = ThreadingHTTPServer((host, 0), Handler)
+        self.httpd.daemon_threads = True
+        self.host = host
+        self.port = self.httpd.server_address[1]
+
+    @property
+    def url(self) -> str:
+        # Alle relativen Pfade der index.html erben das Versionspräfix
+        return f"http://{self.host}:{self.port}/v/{self.build_hash}/index.html"
+
+    def start(self) -> "AssetServer":
+        threading.Thread(target=self.httpd.serve_forever, name="asset-server", daemon=True).start()
+        threading.Thread(target=self._prepare, name="asset-manifest", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def file_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        key = os.path.relpath(path, self.root)
+        entry = self._hashes.get(key)
+        if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            entry = (stat.st_size, stat.st_mtime_ns, h.hexdigest())
+            self._hashes[key] = entry
+        return entry[2]
+
+    def _prepare(self):
+        manifest_path = os.path.join(self.root, MANIFEST_FILE)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self._hashes = {k: tuple(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            self._hashes = {}
+
+        build = hashlib.sha256()
+        for folder, dirs, files in os.walk(self.root):
+            dirs.sort()
+            for name in sorted(files):
+                if name == MANIFEST_FILE:
+                    continue
+                path = os.path.join(folder, name)
+                build.update(os.path.relpath(path, self.root).encode("utf-8"))
+                build.update(self.file_hash(path).encode("ascii"))
+        self.build_hash = build.hexdigest()[:16]
+
+        try:
+            tmp_path = manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._hashes, f)
+            os.replace(tmp_path, manifest_path)
+        except OSError:
+            pass
+        self.ready.set()
+
+
+class _AssetHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    assets: AssetServer = None
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def log_message(self, format, *args):
+        return
+
+    def _serve(self, head: bool):
+        path = unquote(urlsplit(self.path).path)
+        cache_control = REVALIDATE_CACHE
+        match = _VERSIONED.match(path)
+        if match:
+            path = match.group(2)
+            if match.group(1) == self.assets.build_hash:
+                cache_control = IMMUTABLE_CACHE
+        if path.endswith("/"):
+            path += "index.html"
+
+        file_path = self._resolve(path)
+        if file_path is None:
+            self.send_error(404)
+            return
+
+        # Unity fordert .br/.gz-Dateien direkt an und erwartet dann Content-Encoding
+        base, ext = os.path.splitext(file_path)
+        encoding = _ENCODINGS.get(ext)
+        mime_path = base if encoding else file_path
+        if encoding is None:
+            accepted = self.headers.get("Accept-Encoding", "")
+            for suffix, name in _ENCODINGS.items():
+                if name in accepted and os.path.isfile(file_path + suffix):
+                    file_path, encoding = file_path + suffix, name
+                    break
+
+        etag = f'"{self.assets.file_hash(file_path)[:32]}"'
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", cache_control)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        size = os.path.getsize(file_path)
+        start, end = 0, size - 1
+        status = 200
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", etag) == etag:
+            parsed = _parse_range(range_header, size)
+            if parsed is None:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start, end = parsed
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type(mime_path))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", cache_control)
+        self.send_header("Last-Modified", formatdate(os.path.getmtime(file_path), usegmt=True))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if head or size == 0:
+            return
+        self.wfile.flush()
+        with open(file_path, "rb") as f:
+            # sendfile kopiert im Kernel, ohne die Datei durch Python zu schleusen
+            self.connection.sendfile(f, start, end - start + 1)
+
+    def _resolve(self, path: str):
+        # Keine Pfade außerhalb des Build-Ordners
+        parts = [p for p in posixpath.normpath(path).split("/") if p and p not in (".", "..")]
+        file_path = os.path.join(self.assets.root, *parts)
+        if os.path.isfile(file_path) and not file_path.endswith(MANIFEST_FILE):
+            return file_path
+        return None
+
+
+def _parse_range(header: str, size: int):
+    # Nur ein einzelner Bereich; das reicht für Browser und Media-Loader
+    match = _RANGE.match(header.strip())
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if first == "":
+        if last == "":
+            return None
+        length = min(int(last), size)
+        return (size - length, size - 1) if length else None
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
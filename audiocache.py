@@ -0,0 +1,165 @@
+# core/audiocache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+
+# Obergrenze für die Audiodaten im Cache (int16, d. h. ~2 Byte pro Sample)
+AUDIO_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Nach einer Verdrängung wird bis auf diesen Anteil der Obergrenze geleert
+EVICT_TARGET = 0.9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS audio (
+    key TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    sr INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_audio_last_used ON audio(last_used);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def audio_key(text: str, voice: str, model: str, sr: int) -> str:
+    # Inhaltsadresse: normalisierter Text + Stimme + Modell + Abtastrate
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(f"{normalized}\x1f{voice}\x1f{model}\x1f{sr}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Inhaltsadressierter Cache für synthetisierte Sprache mit LRU-Verdrängung.
+
+    Samples liegen als int16 hintereinander in einer Pack-Datei, die per
+    Memory-Mapping gelesen wird; der Index (Offset, Länge, letzte Nutzung) liegt
+    in SQLite. Verdrängte Einträge hinterlassen Lücken, die beim Kompaktieren
+    entfernt werden, sobald sie die Hälfte der Datei ausmachen. Die kompaktierte
+    Datei bekommt einen neuen Namen, der zusammen mit den neuen Offsets in einer
+    Transaktion eingetragen wird.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'pack'").fetchone()
+        self._pack_path = os.path.join(cache_dir, row[0] if row else "audio-0.pack")
+        self._remove_stale_packs()
+        self._pack = open(self._pack_path, "ab")
+        self._map = None
+        self._live_bytes = self._conn.execute("SELECT COALESCE(SUM(samples), 0) FROM audio").fetchone()[0] * 2
+        self._drop_torn_entries()
+
+    def get(self, key: str):
+        """Liefert (float32-Samples, sr) oder None."""
+        with self._lock:
+            row = self._conn.execute("SELECT offset, samples, sr FROM audio WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            offset, samples, sr = row
+            pcm = np.array(self._view()[offset // 2:offset // 2 + samples])
+            with self._conn:
+                self._conn.execute("UPDATE audio SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return pcm.astype(np.float32) / 32767.0, sr
+
+    def put(self, key: str, wav: np.ndarray, sr: int):
+        pcm = (np.clip(np.asarray(wav, dtype=np.float32), -1.0, 1.0) * 32767).astype(np.int16)
+        if pcm.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM audio WHERE key = ?", (key,)).fetchone():
+                return
+            offset = self._pack.tell()
+            self._pack.write(pcm.tobytes())
+            self._pack.flush()
+            with self._conn:
+                self._conn.execute("INSERT INTO audio (key, offset, samples, sr, last_used) VALUES (?, ?, ?, ?, ?)",
+                                   (key, offset, len(pcm), sr, time.time()))
+            self._live_bytes += pcm.nbytes
+            if self._live_bytes > self.max_bytes:
+                self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM audio").fetchone()[0]
+            return {"entries": entries, "bytes": self._live_bytes, "pack_bytes": self._pack.tell(),
+                    "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._map = None
+            self._pack.close()
+            self._conn.close()
+
+    def _view(self) -> np.ndarray:
+        # Mapping erst neu anlegen, wenn die Pack-Datei seit dem letzten Lesen gewachsen ist
+        size = self._pack.tell()
+        if self._map is None or len(self._map) * 2 < size:
+            self._map = np.memmap(self._pack_path, dtype=np.int16, mode="r", shape=(size // 2,)) if size else np.zeros(0, np.int16)
+        return self._map
+
+    def _evict(self):
+        target = self.max_bytes * EVICT_TARGET
+        rows = self._conn.execute("SELECT key, samples FROM audio ORDER BY last_used").fetchall()
+        evicted = []
+        for key, samples in rows:
+            if self._live_bytes <= target:
+                break
+            evicted.append((key,))
+            self._live_bytes -= samples * 2
+        with self._conn:
+            self._conn.executemany("DELETE FROM audio WHERE key = ?", evicted)
+        if self._pack.tell() > 2 * self._live_bytes:
+            self._compact()
+
+    def _compact(self):
+        # Lebende Einträge in eine neue Pack-Datei kopieren; gültig wird sie erst mit dem Commit
+        view = self._view()
+        new_name = f"audio-{time.time_ns()}.pack"
+        new_path = os.path.join(self.cache_dir, new_name)
+        moved = []
+        with open(new_path, "wb") as out:
+            for key, offset, samples in self._conn.execute("SELECT key, offset, samples FROM audio ORDER BY offset"):
+                moved.append((out.tell(), key))
+                out.write(view[offset // 2:offset // 2 + samples].tobytes())
+            out.flush()
+            os.fsync(out.fileno())
+        with self._conn:
+            self._conn.executemany("UPDATE audio SET offset = ? WHERE key = ?", moved)
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('pack', ?)", (new_name,))
+        self._map = None
+        self._pack.close()
+        old_path, self._pack_path = self._pack_path, new_path
+        os.remove(old_path)
+        self._pack = open(self._pack_path, "ab")
+
+    def _remove_stale_packs(self):
+        # Reste einer unterbrochenen Kompaktierung
+        current = os.path.basename(self._pack_path)
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pack") and name != current:
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def _drop_torn_entries(self):
+        # Einträge, deren Daten nach einem Absturz nicht mehr vollständig in der Pack-Datei stehen
+        size = self._pack.tell()
+        with self._conn:
+            torn = self._conn.execute("SELECT key, samples FROM audio WHERE offset + samples * 2 > ?", (size,)).fetchall()
+            self._conn.executemany("DELETE FROM audio WHERE key = ?", [(key,) for key, _s in torn])
+        self._live_bytes -= sum(samples for _k, samples in torn) * 2
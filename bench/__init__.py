@@ -0,0 +1 @@
+# core/bench/__init__.py
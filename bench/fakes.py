@@ -0,0 +1,190 @@
+# core/bench/fakes.py
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_WORDS = (
+    "soft quiet music tea bass drums dream rain night city neon paper gift ritual song "
+    "maybe guess honestly feels like chaotic beauty surreal cute rhythm texture calm warm"
+).split()
+
+
+class FakeOllamaServer:
+    """Lokaler Ersatz für Ollama (/api/generate, gestreamt als NDJSON).
+
+    Antworten sind deterministisch (abhängig vom Prompt). token_rate begrenzt die
+    Ausgabegeschwindigkeit, prompt_rate simuliert die Prompt-Auswertung; wie bei
+    Ollama wird dabei nur der Teil nach dem gemeinsamen Anfang mit dem vorherigen
+    Prompt neu ausgewertet.
+    """
+
+    def __init__(self, token_rate: float = 200.0, prompt_rate: float = 2000.0, host: str = "127.0.0.1", port: int = 0):
+        self.token_rate = token_rate
+        self.prompt_rate = prompt_rate
+        self._last_prompt = ""
+        self._lock = threading.Lock()
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.startswith("/api/generate"):
+                    server._generate(self, body)
+                else:
+                    self._json({})
+
+            def do_GET(self):
+                if self.path.startswith("/api/tags"):
+                    self._json({"models": []})
+                else:
+                    self._json({"version": "0.0.0-fake"})
+
+            def _json(self, data):
+                payload = json.dumps(data).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                return
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-ollama", daemon=True)
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _generate(self, handler, body: dict):
+        prompt = body.get("prompt", "")
+        options = body.get("options") or {}
+        num_predict = options.get("num_predict") or 64
+        with self._lock:
+            self.requests += 1
+            shared = _common_prefix(self._last_prompt, prompt)
+            self._last_prompt = prompt
+        evaluated = max(1, (len(prompt) - shared) // 4)
+        if self.prompt_rate:
+            time.sleep(evaluated / self.prompt_rate)
+
+        seed = int(hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        rng = np.random.default_rng(seed)
+        count = int(rng.integers(max(4, num_predict // 3), num_predict + 1))
+        tokens = []
+        for i in range(count):
+            word = _WORDS[int(rng.integers(len(_WORDS)))]
+            tokens.append((" " if i else "") + word + ("." if rng.random() < 0.12 else ""))
+
+        stream = body.get("stream", True)
+        model = body.get("model", "fake")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson" if stream else "application/json")
+        handler.end_headers()
+        started = time.perf_counter()
+        if stream:
+            for token in tokens:
+                if self.token_rate:
+                    time.sleep(1.0 / self.token_rate)
+                handler.wfile.write(_line({"model": model, "created_at": _now(), "response": token, "done": False}))
+                handler.wfile.flush()
+            final = {"response": ""}
+        else:
+            if self.token_rate:
+                time.sleep(count / self.token_rate)
+            final = {"response": "".join(tokens)}
+        duration = int((time.perf_counter() - started) * 1e9)
+        handler.wfile.write(_line({
+            "model": model, "created_at": _now(), "done": True, "done_reason": "stop",
+            "total_duration": duration, "load_duration": 0,
+            "prompt_eval_count": evaluated, "prompt_eval_duration": int(evaluated / (self.prompt_rate or 1e9) * 1e9),
+            "eval_count": count, "eval_duration": duration, **final,
+        }))
+        handler.wfile.flush()
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministische Feature-Hashing-Embeddings (normiert, dim=384 wie MiniLM)."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            h = int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16)
+            vector[h % self.dim] += 1.0 if (h >> 64) & 1 else -1.0
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        else:
+            vector[0] = 1.0
+        return vector.tolist()
+
+
+class SilentTTS:
+    """TTS-Ersatz: liefert Stille mit plausibler Länge (~14 Zeichen pro Sekunde)."""
+
+    sr = 24000
+
+    def __init__(self, chars_per_second: float = 14.0, realtime_factor: float = 0.0):
+        self.chars_per_second = chars_per_second
+        self.realtime_factor = realtime_factor
+        self.voice_hash = "silent"
+
+    def synthesize(self, text: str) -> np.ndarray:
+        seconds = max(0.1, len(text) / self.chars_per_second)
+        if self.realtime_factor:
+            time.sleep(seconds * self.realtime_factor)
+        return np.zeros(int(seconds * self.sr), dtype=np.float32)
+
+    def speak(self, text: str, output_path: str = None):
+        self.synthesize(text)
+
+
+def silent_player(data: np.ndarray, samplerate: int):
+    return None
+
+
+def _common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    if a[:n] == b[:n]:
+        return n
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _line(data: dict) -> bytes:
+    return json.dumps(data).encode("utf-8") + b"\n"
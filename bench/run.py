@@ -0,0 +1,205 @@
+# core/bench/run.py
+"""Offline-Benchmark: spielt Gespräche gegen lokale Attrappen ab (kein Ollama, kein Netz, nur CPU).
+
+Aufruf aus dem übergeordneten Verzeichnis:
+    python -m core.bench.run --turns 200
+    python -m core.bench.run --turns 1000 --baseline bench_baseline.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+DEFAULT_TOLERANCE = 0.2
+SAMPLE_EVERY = 50
+
+# Werte, bei denen "größer" eine Verschlechterung bedeutet
+BASELINE_KEYS = (
+    "turn_p50_ms", "turn_p95_ms", "append_p95_ms", "save_episode_p95_ms",
+    "search_p95_ms", "bytes_per_turn", "rss_mb",
+)
+
+_OPENERS = ["hey kabo", "so", "honestly", "okay", "you know what", "listen"]
+_SUBJECTS = ["your bass", "the rain tonight", "that weird song", "tea rituals", "my day",
+             "neon signs", "drum patterns", "a dream I had", "gift ideas", "the city at night"]
+_QUESTIONS = ["what do you think?", "does that make sense?", "tell me more.", "any ideas?",
+              "is that strange?", "why though?"]
+
+
+def scripted_turns(turns: int, script_path: str = None):
+    """Liefert turns Benutzereingaben: aus einer Skriptdatei (zyklisch) oder deterministisch erzeugt."""
+    if script_path:
+        with open(script_path, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        if not lines:
+            raise ValueError(f"Skript {script_path} ist leer")
+        for i in range(turns):
+            yield lines[i % len(lines)]
+        return
+    for i in range(turns):
+        yield (f"{_OPENERS[i % len(_OPENERS)]}, {_SUBJECTS[(i * 7) % len(_SUBJECTS)]} "
+               f"#{i} - {_QUESTIONS[(i * 3) % len(_QUESTIONS)]}")
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def run(args) -> dict:
+    data_dir = tempfile.mkdtemp(prefix="kabo-bench-")
+    from core.bench.fakes import FakeOllamaServer, HashEmbeddings, SilentTTS, silent_player
+    server = FakeOllamaServer(token_rate=args.token_rate).start()
+
+    # Pfade und Ollama-URL werden beim Import der Kernmodule gelesen
+    os.environ["KABO_DATA_DIR"] = data_dir
+    os.environ["KABO_OLLAMA_URL"] = server.url
+
+    from core import memory, speak
+    from core.memory import CachedEmbeddings, EMBEDDING_CACHE_DIR
+    from core.intelligents import KaboAI, SimpleMemory
+    from langchain_core.messages import HumanMessage, AIMessage
+
+    memory.embedding.override(CachedEmbeddings(HashEmbeddings(), os.path.join(EMBEDDING_CACHE_DIR, "hash")))
+    speak.tts.override(SilentTTS())
+
+    print(f"Benchmark: {args.turns} Turns, {args.token_rate} Tokens/s, Daten in {data_dir}")
+    ai = KaboAI(stream_speech=not args.no_speech)
+    ai.player = silent_player
+
+    turn_ms, series = [], []
+    for i, user_input in enumerate(scripted_turns(args.turns, args.script), 1):
+        ms, _ = timed(ai.get_response, user_input)
+        turn_ms.append(ms)
+        if i % SAMPLE_EVERY == 0 or i == args.turns:
+            store = memory.vectorstore.get()
+            series.append({
+                "turn": i,
+                "turn_p95_ms": round(percentile(turn_ms[-SAMPLE_EVERY:], 0.95), 2),
+                "data_bytes": dir_bytes(data_dir),
+                "index_size": len(store),
+                "rss_mb": round(rss_mb(), 1),
+            })
+            print(f"  Turn {i}: p95 {series[-1]['turn_p95_ms']} ms, "
+                  f"{series[-1]['data_bytes'] / 1024:.0f} KiB, {series[-1]['index_size']} Vektoren, "
+                  f"{series[-1]['rss_mb']} MB RSS")
+    ai.consolidator.flush()
+
+    # Einzelne Bausteine ohne LLM-Aufruf messen
+    extra = SimpleMemory(os.path.join(data_dir, "bench_memory.jsonl"))
+    append_ms = [timed(extra.add_message, (HumanMessage if n % 2 == 0 else AIMessage)(content=f"nachricht {n}"))[0]
+                 for n in range(args.ops)]
+    extra.close()
+
+    episode_ms = []
+    for n in range(max(1, args.ops // 10)):
+        msgs = [HumanMessage(content=f"frage {n}"), AIMessage(content=f"antwort {n}")]
+        episode_ms.append(timed(memory.save_episode, f"episode {n}", f"zusammenfassung {n} über musik",
+                                msgs, topic="music", mood="chill")[0])
+
+    queries = list(scripted_turns(max(1, args.ops // 10)))
+    search_ms = [timed(memory.search_vectorstore, q, k=3)[0] for q in queries]
+
+    ai.shutdown()
+    server.stop()
+
+    total_bytes = dir_bytes(data_dir)
+    return {
+        "turns": args.turns,
+        "token_rate": args.token_rate,
+        "turn_p50_ms": round(percentile(turn_ms, 0.5), 2),
+        "turn_p95_ms": round(percentile(turn_ms, 0.95), 2),
+        "append_p95_ms": round(percentile(append_ms, 0.95), 3),
+        "save_episode_p95_ms": round(percentile(episode_ms, 0.95), 2),
+        "search_p95_ms": round(percentile(search_ms, 0.95), 2),
+        "bytes_per_turn": round(total_bytes / max(1, args.turns), 1),
+        "index_size": len(memory.vectorstore.get()),
+        "rss_mb": round(rss_mb(), 1),
+        "llm_requests": server.requests,
+        "series": series,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for key in BASELINE_KEYS:
+        old, new = baseline.get(key), result.get(key)
+        if not old or new is None:
+            continue
+        if new > old * (1 + tolerance):
+            regressions.append(f"{key}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline-Benchmark für Kabo")
+    parser.add_argument("--turns", type=int, default=100, help="Anzahl der Gesprächsrunden (10 bis 100000)")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Tokens pro Sekunde des Fake-Ollama")
+    parser.add_argument("--script", help="Textdatei mit einer Benutzereingabe pro Zeile")
+    parser.add_argument("--ops", type=int, default=1000, help="Anzahl Einzeloperationen je Baustein")
+    parser.add_argument("--no-speech", action="store_true", help="Nicht-gestreamter Pfad ohne Satz-TTS")
+    parser.add_argument("--output", help="Ergebnis als JSON speichern")
+    parser.add_argument("--baseline", help="JSON-Baseline zum Vergleich")
+    parser.add_argument("--update-baseline", action="store_true", help="Baseline mit diesem Lauf überschreiben")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Erlaubte Verschlechterung (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    if not 10 <= args.turns <= 100000:
+        parser.error("--turns muss zwischen 10 und 100000 liegen")
+
+    result = run(args)
+    summary = {k: v for k, v in result.items() if k != "series"}
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        if args.update_baseline or not os.path.exists(args.baseline):
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+            print(f"Baseline gespeichert: {args.baseline}")
+            return 0
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline, args.tolerance)
+        if regressions:
+            print("Regressionen gegenüber der Baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("Keine Regressionen gegenüber der Baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# core/bench/tts_cpu.py
+"""CPU-Benchmark der TTS: Echtzeitfaktor und Spitzen-RSS je Konfiguration.
+
+Jede Konfiguration läuft in einem eigenen Prozess, damit Thread-Einstellungen
+und Speicherspitzen sich nicht gegenseitig beeinflussen.
+
+Aufruf aus dem übergeordneten Verzeichnis:
+    python -m core.bench.tts_cpu
+    python -m core.bench.tts_cpu --threads 4 8 --no-compile --output tts_cpu.json
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+SENTENCES = [
+    "Hey, it's nice to hear from you again.",
+    "I guess the rain makes everything feel a little slower tonight.",
+    "Maybe we could try a softer bass line, something that breathes.",
+    "Honestly? I've been thinking about that song all day.",
+]
+VOICE_SAMPLE = os.path.join(os.path.dirname(__file__), "..", "..", "models", "Kikuri_VA_Sample.wav")
+
+
+def run_config(config: dict) -> dict:
+    """Läuft im Kindprozess: Modell laden, aufwärmen, Sätze synthetisieren."""
+    from core.speak import KaboTTS
+    voice = config.get("voice")
+    started = time.perf_counter()
+    tts = KaboTTS(device="cpu", audio_prompt_path=voice if voice and os.path.exists(voice) else None,
+                  quantize=config["quantize"], threads=config["threads"],
+                  interop_threads=config["interop_threads"], compile_model=config["compile"],
+                  audio_cache_dir=None)
+    load_seconds = time.perf_counter() - started
+
+    # Erster Aufruf enthält Initialisierung bzw. Kompilieren und zählt nicht zum RTF
+    started = time.perf_counter()
+    tts.synthesize(SENTENCES[0])
+    warmup_seconds = time.perf_counter() - started
+
+    synth_seconds = audio_seconds = 0.0
+    for _ in range(config["repeat"]):
+        for sentence in SENTENCES:
+            started = time.perf_counter()
+            wav = tts.synthesize(sentence)
+            synth_seconds += time.perf_counter() - started
+            audio_seconds += len(wav) / tts.sr
+    return {
+        **config,
+        "load_seconds": round(load_seconds, 2),
+        "warmup_seconds": round(warmup_seconds, 2),
+        "rtf": round(synth_seconds / audio_seconds, 3) if audio_seconds else None,
+        # ru_maxrss ist unter Linux in KiB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def configurations(args) -> list:
+    compile_options = [False] if args.no_compile else [False, True]
+    return [
+        {"quantize": quantize, "threads": threads, "interop_threads": args.interop_threads,
+         "compile": compile_model, "repeat": args.repeat, "voice": args.voice}
+        for quantize, threads, compile_model in itertools.product([False, True], args.threads, compile_options)
+    ]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="CPU-Benchmark der TTS")
+    parser.add_argument("--threads", type=int, nargs="+", default=[os.cpu_count() or 1],
+                        help="Zu testende Thread-Zahlen (intra-op)")
+    parser.add_argument("--interop-threads", type=int, default=1)
+    parser.add_argument("--no-compile", action="store_true", help="torch.compile nicht testen")
+    parser.add_argument("--repeat", type=int, default=2, help="Durchläufe über alle Testsätze")
+    parser.add_argument("--voice", default=VOICE_SAMPLE, help="Referenz-wav für die Stimme")
+    parser.add_argument("--output", help="Ergebnisse als JSON speichern")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_config(json.loads(args.worker))))
+        return 0
+
+    results = []
+    for config in configurations(args):
+        label = (f"{'int8' if config['quantize'] else 'fp32'}, {config['threads']} Threads"
+                 f"{', compile' if config['compile'] else ''}")
+        print(f"Teste {label} ...", flush=True)
+        proc = subprocess.run([sys.executable, "-m", "core.bench.tts_cpu", "--worker", json.dumps(config)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"  fehlgeschlagen: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result["label"] = label
+        results.append(result)
+        print(f"  RTF {result['rtf']}, Spitzen-RSS {result['peak_rss_mb']} MB, Laden {result['load_seconds']} s")
+
+    if results:
+        best = min(results, key=lambda r: r["rtf"] or float("inf"))
+        print(f"Schnellste Konfiguration: {best['label']} (RTF {best['rtf']})")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
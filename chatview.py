@@ -0,0 +1,276 @@
+# core/chatview.py
+from collections import OrderedDict
+from PyQt5.QtWidgets import QListView, QStyledItemDelegate, QAbstractItemView
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QSize, QTimer
+from PyQt5.QtGui import QColor, QPainter, QPixmap, QFontMetrics
+
+# Zeilen, die beim Hochscrollen auf einmal nachgeladen werden
+PAGE_SIZE = 50
+# Höchstens so viele Zeilen hält das Modell; ältere werden bei Bedarf erneut geladen
+MAX_ROWS = 400
+# Gerenderte Sprechblasen (Pixmaps) im LRU-Cache
+RENDER_CACHE_SIZE = 256
+
+ROLE_KIND = Qt.UserRole + 1
+ROLE_REVISION = Qt.UserRole + 2
+
+SPEAKERS = {"user": "Pascal", "kabo": "Kabo-chan"}
+COLORS = {"user": QColor("#c8d2bb"), "kabo": QColor("#a1446c")}
+BUBBLE_COLOR = QColor("#1E1E1E")
+PADDING = 10
+SPACING = 6
+
+
+class ChatModel(QAbstractListModel):
+    """Nachrichten als Zeilen; Anhängen kostet unabhängig von der Verlaufslänge gleich viel."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Zeilen: [kind, text, revision, key, position]; position = Index im Gedächtnis (None = nicht gespeichert)
+        self._rows = []
+        self._next_key = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        kind, text, revision, key, _position = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return text
+        if role == ROLE_KIND:
+            return kind
+        if role == ROLE_REVISION:
+            return (key, revision)
+        return None
+
+    def append_message(self, kind: str, text: str = "", position: int = None) -> int:
+        """Hängt eine Zeile an und liefert ihren Schlüssel (bleibt beim Kürzen gültig)."""
+        row = len(self._rows)
+        key = self._new_key()
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._rows.append([kind, text, 0, key, position])
+        self.endInsertRows()
+        return key
+
+    def append_text(self, text: str, key: int = None):
+        # Gestreamte Tokens landen in der Zeile mit `key` (sonst der letzten); nur diese wird neu gemessen
+        row = self._row_of(key)
+        if row is None:
+            return
+        target = self._rows[row]
+        target[1] += text
+        target[2] += 1
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def set_position(self, key: int, position: int):
+        row = self._row_of(key)
+        if row is not None:
+            self._rows[row][4] = position
+
+    def last_text(self) -> str:
+        return self._rows[-1][1] if self._rows else ""
+
+    def _row_of(self, key: int = None):
+        if not self._rows:
+            return None
+        if key is None:
+            return len(self._rows) - 1
+        # Die gesuchte Zeile ist fast immer eine der letzten
+        for row in range(len(self._rows) - 1, -1, -1):
+            if self._rows[row][3] == key:
+                return row
+        return None
+
+    def prepend_messages(self, messages):
+        if not messages:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(messages) - 1)
+        self._rows[:0] = [[kind, text, 0, self._new_key(), position] for kind, text, position in messages]
+        self.endInsertRows()
+
+    def drop_front(self, count: int):
+        """Entfernt die ältesten Zeilen; liefert die Position, vor der nachgeladen werden muss."""
+        count = min(count, len(self._rows))
+        if count <= 0:
+            return None
+        positions = [row[4] for row in self._rows]
+        # Kleinste Position ab jeder Zeile
+        lowest = [None] * (len(positions) + 1)
+        for i in range(len(positions) - 1, -1, -1):
+            below = lowest[i + 1]
+            lowest[i] = positions[i] if below is None or (positions[i] is not None and positions[i] < below) else below
+        highest = max((p for p in positions[:count] if p is not None), default=None)
+        # Während einer Antwort getippte Nachrichten stehen im Gedächtnis erst nach dieser Antwort;
+        # weiter kürzen, bis keine verbleibende Zeile älter ist als eine entfernte
+        while count < len(positions) and highest is not None and lowest[count] is not None \
+                and lowest[count] < highest:
+            if positions[count] is not None:
+                highest = max(highest, positions[count])
+            count += 1
+        self.beginRemoveRows(QModelIndex(), 0, count - 1)
+        del self._rows[:count]
+        self.endRemoveRows()
+        if lowest[count] is not None:
+            return lowest[count]
+        return None if highest is None else highest + 1
+
+    def _new_key(self) -> int:
+        self._next_key += 1
+        return self._next_key
+
+
+class BubbleDelegate(QStyledItemDelegate):
+    """Zeichnet Sprechblasen und cached sowohl die Größe als auch das gerenderte Bild."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._sizes = OrderedDict()
+        self._pixmaps = OrderedDict()
+
+    def sizeHint(self, option, index):
+        width = max(100, option.rect.width() or self.parent().viewport().width())
+        cache_key = (index.data(ROLE_REVISION), width)
+        size = self._sizes.get(cache_key)
+        if size is None:
+            size = self._measure(option, index, width)
+            _remember(self._sizes, cache_key, size, RENDER_CACHE_SIZE * 4)
+        return size
+
+    def paint(self, painter: QPainter, option, index):
+        width = option.rect.width()
+        cache_key = (index.data(ROLE_REVISION), width)
+        pixmap = self._pixmaps.get(cache_key)
+        if pixmap is None:
+            pixmap = self._render(option, index, width)
+            _remember(self._pixmaps, cache_key, pixmap, RENDER_CACHE_SIZE)
+        else:
+            self._pixmaps.move_to_end(cache_key)
+        painter.drawPixmap(option.rect.topLeft(), pixmap)
+
+    def _layout(self, option, index, width):
+        metrics = QFontMetrics(option.font)
+        kind = index.data(ROLE_KIND)
+        text = f"{SPEAKERS.get(kind, kind)}: {index.data(Qt.DisplayRole)}"
+        inner = max(10, width - 2 * PADDING - 2 * SPACING)
+        bounds = metrics.boundingRect(QRect(0, 0, inner, 100000), Qt.TextWordWrap, text)
+        return text, kind, bounds
+
+    def _measure(self, option, index, width) -> QSize:
+        _text, _kind, bounds = self._layout(option, index, width)
+        return QSize(width, bounds.height() + 2 * PADDING + SPACING)
+
+    def _render(self, option, index, width) -> QPixmap:
+        text, kind, bounds = self._layout(option, index, width)
+        size = self._measure(option, index, width)
+        pixmap = QPixmap(size)
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setFont(option.font)
+        bubble = QRect(SPACING, SPACING // 2, width - 2 * SPACING, size.height() - SPACING)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(BUBBLE_COLOR)
+        painter.drawRoundedRect(bubble, 6, 6)
+        painter.setPen(COLORS.get(kind, QColor("#EEEEEE")))
+        painter.drawText(bubble.adjusted(PADDING, PADDING, -PADDING, -PADDING), Qt.TextWordWrap, text)
+        painter.end()
+        return pixmap
+
+
+class ChatView(QListView):
+    """Virtualisierte Chat-Ansicht: gezeichnet werden nur sichtbare Zeilen.
+
+    `page_loader(before, limit)` liefert ältere Nachrichten als ([(kind, text, position), ...],
+    start, end); `before` ist die Position der ältesten angezeigten Nachricht (None = Ende
+    des Verlaufs). Live angehängte Nachrichten bekommen ihre Position erst, wenn sie im
+    Gedächtnis landen (set_position); nie gespeicherte Zeilen wie Fehlermeldungen haben keine.
+    """
+
+    def __init__(self, page_loader=None, parent=None):
+        super().__init__(parent)
+        self.page_loader = page_loader
+        self.chat_model = ChatModel(self)
+        self.setModel(self.chat_model)
+        self.setItemDelegate(BubbleDelegate(self))
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setResizeMode(QListView.Adjust)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setFocusPolicy(Qt.NoFocus)
+        self.setUniformItemSizes(False)
+        # Position der ältesten geladenen Nachricht im Gedächtnis
+        self._oldest = None
+        self._exhausted = page_loader is None
+        self._loading = False
+        self.verticalScrollBar().valueChanged.connect(self._on_scroll)
+
+    def load_initial(self):
+        self._load_older()
+        self.scrollToBottom()
+
+    def add_message(self, kind: str, text: str = "") -> int:
+        follow = self._at_bottom()
+        key = self.chat_model.append_message(kind, text)
+        self._trim()
+        if follow:
+            self.scrollToBottom()
+        return key
+
+    def append_text(self, text: str, key: int = None):
+        follow = self._at_bottom()
+        self.chat_model.append_text(text, key)
+        if follow:
+            self.scrollToBottom()
+
+    def set_position(self, key: int, position: int):
+        self.chat_model.set_position(key, position)
+
+    def last_text(self) -> str:
+        return self.chat_model.last_text()
+
+    def _at_bottom(self) -> bool:
+        bar = self.verticalScrollBar()
+        return bar.value() >= bar.maximum() - 4
+
+    def _trim(self):
+        # Nur kürzen, wenn der Nutzer unten liest; gekürzte Zeilen werden beim Hochscrollen nachgeladen
+        excess = self.chat_model.rowCount() - MAX_ROWS
+        if excess <= 0 or not self._at_bottom() or self.page_loader is None:
+            return
+        position = self.chat_model.drop_front(excess)
+        if position is not None:
+            self._oldest = position
+            self._exhausted = False
+
+    def _on_scroll(self, value: int):
+        if value == self.verticalScrollBar().minimum() and not self._exhausted and not self._loading:
+            # Nach dem aktuellen Scroll-Ereignis laden, damit Qt die Geometrie fertig berechnet
+            self._loading = True
+            QTimer.singleShot(0, self._load_older_keep_position)
+
+    def _load_older_keep_position(self):
+        bar = self.verticalScrollBar()
+        before_max = bar.maximum()
+        added = self._load_older()
+        if added:
+            # Ansicht an derselben Nachricht halten, statt an den Anfang zu springen
+            self.doItemsLayout()
+            bar.setValue(bar.maximum() - before_max)
+        self._loading = False
+
+    def _load_older(self) -> int:
+        if self.page_loader is None or self._exhausted:
+            return 0
+        messages, start, _end = self.page_loader(self._oldest, PAGE_SIZE)
+        self._exhausted = start <= 0
+        self.chat_model.prepend_messages(messages)
+        self._oldest = start
+        return len(messages)
+
+
+def _remember(cache: OrderedDict, key, value, capacity: int):
+    cache[key] = value
+    if len(cache) > capacity:
+        cache.popitem(last=False)
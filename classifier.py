@@ -0,0 +1,45 @@
+# core/classifier.py
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+class CentroidClassifier:
+    """Ordnet einen Text per Kosinus-Ähnlichkeit dem nächsten Gruppen-Schwerpunkt zu.
+
+    Mehrere Gruppen (z. B. Stimmungen und Themen) teilen sich eine gestapelte
+    Schwerpunktmatrix, sodass eine Eingabe mit einer einzigen Matrixmultiplikation
+    gegen alle Gruppen verglichen wird.
+    """
+
+    def __init__(self, groups: Dict[str, Dict[str, List[str]]], embed_documents):
+        self.labels: List[Tuple[str, str]] = []
+        phrases: List[str] = []
+        owners: List[int] = []
+        for group, examples in groups.items():
+            for label, texts in examples.items():
+                self.labels.append((group, label))
+                phrases.extend(texts)
+                owners.extend([len(self.labels) - 1] * len(texts))
+
+        # Alle Beispielsätze in einem Aufruf einbetten und pro Label mitteln
+        vectors = _normalize(np.asarray(embed_documents(phrases), dtype=np.float32))
+        owners = np.asarray(owners)
+        centroids = np.stack([vectors[owners == i].mean(axis=0) for i in range(len(self.labels))])
+        self.centroids = _normalize(centroids)
+        self._groups = {group: np.asarray([i for i, (g, _l) in enumerate(self.labels) if g == group])
+                        for group in groups}
+
+    def classify(self, vector) -> Dict[str, Tuple[Optional[str], float]]:
+        """Bestes Label und Ähnlichkeit je Gruppe."""
+        vector = _normalize(np.asarray(vector, dtype=np.float32)[None, :])[0]
+        scores = self.centroids @ vector
+        result = {}
+        for group, rows in self._groups.items():
+            best = rows[int(np.argmax(scores[rows]))]
+            result[group] = (self.labels[best][1], float(scores[best]))
+        return result
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
@@ -0,0 +1,187 @@
+# core/consolidation.py
+import queue
+import threading
+from collections import Counter
+from typing import List
+from langchain_core.messages import BaseMessage
+from core.memory import summarize_messages, save_episodes
+from core.dispatch import Superseded
+from core.tracing import span
+
+# Alle N Turns (oder nach IDLE_SECONDS ohne neue Nachricht) wird eine Episode gebildet
+CONSOLIDATE_EVERY = 5
+IDLE_SECONDS = 60.0
+# Fehlgeschlagene Fenster werden beim nächsten Durchlauf erneut versucht, höchstens so oft
+MAX_ATTEMPTS = 3
+
+_STOP = object()
+_ALL = object()
+
+
+class _KeyedJob:
+    def __init__(self, job, key: str, release):
+        self.job = job
+        self.key = key
+        self.release = release
+        self.__name__ = getattr(job, "__name__", "background_job")
+
+    def __call__(self):
+        # Ab jetzt darf derselbe Job wieder eingereiht werden
+        self.release(self.key)
+        return self.job()
+
+
+class ConsolidationWorker:
+    """Fasst Gesprächsrunden im Hintergrund zu Episoden zusammen.
+
+    Turns werden gesammelt und erst gebündelt zusammengefasst und gespeichert,
+    damit die Antwortlatenz nur aus Retrieval und LLM-Aufruf besteht.
+    """
+
+    def __init__(self, every_n_turns: int = CONSOLIDATE_EVERY, idle_seconds: float = IDLE_SECONDS):
+        self.every_n_turns = every_n_turns
+        self.idle_seconds = idle_seconds
+        self._jobs = queue.Queue()
+        # Offene Turns je Sitzung (None = Desktop-App)
+        self._pending = {}
+        # Fehlgeschlagene Fenster je Sitzung: [turns, Zusammenfassung oder None, Versuche]
+        self._failed = {}
+        self._stopped = False
+        self._queued_keys = set()
+        self._keys_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="memory-consolidation", daemon=True)
+        self._thread.start()
+
+    def submit_turn(self, topic: str, messages: List[BaseMessage], mood: str = None, session: str = None):
+        # Ein Worker kann mehrere Sitzungen bedienen; Episoden werden nie sitzungsübergreifend gebildet
+        if self._stopped:
+            return
+        self._jobs.put((topic, mood, list(messages), session))
+
+    def submit_job(self, job, key: str = None):
+        # Beliebige Hintergrundarbeit (z. B. Fortschreiben der Kontext-Zusammenfassung).
+        # Ein Job mit gleichem key, der noch wartet, wird nicht ein zweites Mal eingereiht.
+        if self._stopped:
+            return
+        if key is not None:
+            with self._keys_lock:
+                if key in self._queued_keys:
+                    return
+                self._queued_keys.add(key)
+            job = _KeyedJob(job, key, self._release_key)
+        self._jobs.put(job)
+
+    def is_queued(self, key: str) -> bool:
+        with self._keys_lock:
+            return key in self._queued_keys
+
+    def _release_key(self, key: str):
+        with self._keys_lock:
+            self._queued_keys.discard(key)
+
+    def flush(self, timeout: float = None) -> bool:
+        # Alle offenen Turns sofort verarbeiten und darauf warten
+        done = threading.Event()
+        self._jobs.put(done)
+        return done.wait(timeout)
+
+    def stop(self, timeout: float = None):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._jobs.put(_STOP)
+        self._thread.join(timeout)
+        lost = sum(len(entries) for entries in self._failed.values())
+        if lost:
+            print(f"{lost} Episode(n) konnten vor dem Beenden nicht gespeichert werden.")
+
+    def _run(self):
+        while True:
+            try:
+                job = self._jobs.get(timeout=self.idle_seconds)
+            except queue.Empty:
+                self._consolidate()
+                continue
+
+            if job is _STOP:
+                self._consolidate()
+                return
+            if isinstance(job, threading.Event):
+                self._consolidate()
+                job.set()
+                continue
+            if callable(job):
+                try:
+                    with span(getattr(job, "__name__", "background_job")):
+                        job()
+                except Superseded:
+                    pass
+                except Exception as e:
+                    print(f"Fehler im Hintergrundjob: {e}")
+                continue
+
+            session = job[3]
+            self._pending.setdefault(session, []).append(job)
+            if len(self._pending[session]) >= self.every_n_turns:
+                self._consolidate(session)
+
+    def _consolidate(self, only_session=_ALL):
+        # Ohne Argument werden alle Sitzungen verarbeitet (Leerlauf, flush, stop)
+        if only_session is _ALL:
+            by_session, self._pending = self._pending, {}
+            failed, self._failed = self._failed, {}
+        else:
+            by_session = {only_session: self._pending.pop(only_session, [])}
+            failed = {only_session: self._failed.pop(only_session, [])}
+
+        # Zuerst die älteren, fehlgeschlagenen Fenster, damit die Reihenfolge erhalten bleibt
+        windows = []
+        for session in dict.fromkeys([*failed, *by_session]):
+            windows.extend((session, entry) for entry in failed.get(session, []))
+            session_turns = by_session.get(session, [])
+            for start in range(0, len(session_turns), self.every_n_turns):
+                windows.append((session, [session_turns[start:start + self.every_n_turns], None, 0]))
+        if not windows:
+            return
+
+        batch, saved = [], []
+        for session, entry in windows:
+            window, summary, _attempts = entry
+            messages = [m for _topic, _mood, turn_messages, _s in window for m in turn_messages]
+            if summary is None:
+                try:
+                    with span("summarize_messages", messages=len(messages)):
+                        entry[1] = summary = summarize_messages(messages)
+                except Exception as e:
+                    print(f"Fehler bei der Zusammenfassung: {e}")
+                    self._retry(session, entry)
+                    continue
+            topic = Counter(t for t, _mood, _m, _s in window if t).most_common(1)
+            topic = topic[0][0] if topic else "something interesting"
+            batch.append({
+                "title": f"Conversation about {topic}",
+                "summary": summary,
+                "messages": messages,
+                "topic": topic,
+                "mood": window[-1][1],
+                "session": session,
+            })
+            saved.append((session, entry))
+
+        if not batch:
+            return
+        try:
+            with span("save_episode", episodes=len(batch)):
+                save_episodes(batch)
+        except Exception as e:
+            print(f"Fehler beim Speichern der Episoden: {e}")
+            # Zusammenfassungen bleiben erhalten; beim nächsten Versuch wird nur gespeichert
+            for session, entry in saved:
+                self._retry(session, entry)
+
+    def _retry(self, session, entry):
+        entry[2] += 1
+        if entry[2] >= MAX_ATTEMPTS:
+            print(f"Episode nach {entry[2]} Versuchen verworfen ({len(entry[0])} Turns).")
+            return
+        self._failed.setdefault(session, []).append(entry)
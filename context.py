@@ -0,0 +1,146 @@
+# core/context.py
+import json
+import os
+import threading
+from typing import List
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from core.memory import fold_into_summary, ROLLING_SUMMARY_FILE
+
+# Token-Budget für Zusammenfassung + Verlauf + abgerufene Fakten im Prompt
+TOKEN_BUDGET = 1536
+# Höchstanteil des Budgets für abgerufene Fakten
+CONTEXT_SHARE = 0.25
+# So viele Nachrichten bleiben immer wörtlich erhalten
+MIN_RECENT_MESSAGES = 4
+# Verdrängt wird blockweise, damit der Prompt-Anfang zwischen zwei Faltungen stabil bleibt
+EVICT_BATCH = 8
+FACTS_HEADER = "[Relevant Facts from Memory]"
+
+
+def count_tokens(text: str) -> int:
+    # Grobe Schätzung (~4 Zeichen pro Token), ohne Tokenizer laden zu müssen
+    return (len(text) + 3) // 4
+
+
+def format_message(msg: BaseMessage) -> str:
+    if isinstance(msg, HumanMessage):
+        return f"User: {msg.content}"
+    if isinstance(msg, AIMessage):
+        return f"Kabo-chan: {msg.content}"
+    if isinstance(msg, SystemMessage):
+        return msg.content
+    return str(msg.content)
+
+
+class ContextBuilder:
+    """Baut den Gesprächskontext für den Prompt innerhalb eines Token-Budgets.
+
+    Die jüngsten Nachrichten bleiben wörtlich erhalten. Ältere Nachrichten werden
+    blockweise verdrängt und in eine fortlaufende Zusammenfassung eingearbeitet,
+    wobei jede Nachricht genau einmal zusammengefasst wird.
+    """
+
+    def __init__(self, budget: int = TOKEN_BUDGET, token_counter=count_tokens,
+                 summary_path: str = ROLLING_SUMMARY_FILE):
+        self.budget = budget
+        self.count_tokens = token_counter
+        self.summary_path = summary_path
+        self._lock = threading.Lock()
+        self.summary = ""
+        # Höchste Nachrichten-ID, die bereits in der Zusammenfassung steckt
+        self.folded_upto = -1
+        # Nachrichten ab dieser ID stehen wörtlich im Prompt
+        self.window_start = -1
+        self._pending: List[BaseMessage] = []
+        self._load()
+
+    def build(self, messages: List[BaseMessage], facts: List[str] = ()) -> dict:
+        context = self._fit_context(facts)
+        with self._lock:
+            summary = self.summary
+            window = [m for m in messages if _msg_id(m) > self.window_start]
+
+        remaining = self.budget - self.count_tokens(context) - self.count_tokens(summary)
+        costs = [self.count_tokens(format_message(m)) for m in window]
+        total = sum(costs)
+
+        cut = 0
+        while total > remaining and len(window) - cut > MIN_RECENT_MESSAGES:
+            step = min(EVICT_BATCH, len(window) - cut - MIN_RECENT_MESSAGES)
+            total -= sum(costs[cut:cut + step])
+            cut += step
+
+        if cut:
+            with self._lock:
+                self._pending.extend(m for m in window[:cut] if _msg_id(m) > self.folded_upto)
+                self.window_start = max(self.window_start, _msg_id(window[cut - 1]))
+            window = window[cut:]
+
+        history = "\n".join(format_message(m) for m in window)
+        if summary:
+            history = f"[Summary of earlier conversation]\n{summary}\n\n{history}"
+        return {"chat_history": history, "context": context}
+
+    def has_pending(self) -> bool:
+        with self._lock:
+            return bool(self._pending)
+
+    def fold_pending(self, stale=None):
+        """Arbeitet verdrängte Nachrichten in die Zusammenfassung ein (LLM-Aufruf).
+
+        Wird die Faltung als veraltet verworfen (`stale`), kommen die Nachrichten zurück
+        und die nächste Faltung übernimmt sie mit.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            summary = self.summary
+        if not pending:
+            return
+        try:
+            summary = fold_into_summary(summary, pending, stale=stale)
+        except Exception:
+            with self._lock:
+                self._pending = pending + self._pending
+            raise
+        with self._lock:
+            self.summary = summary
+            self.folded_upto = max(self.folded_upto, max(_msg_id(m) for m in pending))
+            self._save()
+
+    def reset(self):
+        with self._lock:
+            self.summary = ""
+            self._pending = []
+            self._save()
+
+    def _fit_context(self, facts: List[str]) -> str:
+        # Fakten einzeln und nach Rang übernehmen; was nicht mehr passt, fällt ganz weg,
+        # damit mehrzeilige Zusammenfassungen nicht mittendrin abgeschnitten werden
+        limit = int(self.budget * CONTEXT_SHARE)
+        kept = []
+        for fact in facts:
+            candidate = "\n".join([FACTS_HEADER, *kept, fact]) + "\n"
+            if self.count_tokens(candidate) <= limit:
+                kept.append(fact)
+        if not kept:
+            return ""
+        return "\n".join([FACTS_HEADER, *kept]) + "\n"
+
+    def _load(self):
+        if not os.path.exists(self.summary_path):
+            return
+        with open(self.summary_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.summary = data.get("summary", "")
+        self.folded_upto = data.get("folded_upto", -1)
+        self.window_start = self.folded_upto
+
+    def _save(self):
+        tmp_path = self.summary_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary, "folded_upto": self.folded_upto}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.summary_path)
+
+
+def _msg_id(msg: BaseMessage) -> int:
+    return int(msg.id) if msg.id and str(msg.id).isdigit() else -1
@@ -0,0 +1,195 @@
+# core/dispatch.py
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from core.tracing import metrics
+
+# Prioritäten: kleinere Zahl kommt zuerst dran
+INTERACTIVE = 0
+CONSOLIDATION = 1
+MAINTENANCE = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", CONSOLIDATION: "consolidation", MAINTENANCE: "maintenance"}
+
+# Gleichzeitige Anfragen an Ollama; sollte OLLAMA_NUM_PARALLEL entsprechen
+LLM_SLOTS = int(os.environ.get("KABO_LLM_SLOTS", "1"))
+
+
+class LLMDispatcher:
+    """Vergibt die Ollama-Slots nach Priorität.
+
+    Interaktive Antworten haben Vorrang: Ist kein Slot frei, wird laufende
+    Hintergrundarbeit verdrängt. Ihr Slot bleibt belegt, bis der Stream beim nächsten
+    Token geschlossen ist, damit Ollama nie mehr als `slots` Anfragen gleichzeitig
+    bearbeitet; während der Prompt-Auswertung kann das dauern. Veraltete Arbeit
+    (`stale()` liefert True, z. B. weil schon eine neuere Faltung wartet) wird
+    verworfen statt neu gestartet. Gleiche Hintergrundanfragen, die gleichzeitig
+    laufen, werden zu einer zusammengefasst.
+    """
+
+    def __init__(self, slots: int = LLM_SLOTS):
+        self.slots = max(1, slots)
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # Heap aus (Priorität, Reihenfolge) der wartenden Anfragen
+        self._waiting = []
+        # Laufende Anfragen: Eintrag -> (Priorität, Verdrängungs-Event)
+        self._running = {}
+        self._inflight = {}
+        self.counts = {"completed": 0, "preempted": 0, "coalesced": 0, "dropped": 0}
+
+    @contextmanager
+    def slot(self, priority: int = INTERACTIVE):
+        """Belegt einen Slot; das gelieferte Event wird gesetzt, wenn die Arbeit verdrängt wird."""
+        entry = (priority, next(self._seq))
+        queued = time.perf_counter()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            metrics.observe("kabo_llm_queue_depth", PRIORITY_NAMES[priority], len(self._waiting) - 1)
+            try:
+                while len(self._running) >= self.slots or self._waiting[0] != entry:
+                    if priority == INTERACTIVE and len(self._running) >= self.slots:
+                        self._preempt_background()
+                    self._cond.wait(0.5)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            preempted = threading.Event()
+            self._running[entry] = (priority, preempted)
+            # Der nächste Wartende prüft, ob noch ein Slot frei ist
+            self._cond.notify_all()
+        metrics.observe("kabo_llm_wait_seconds", PRIORITY_NAMES[priority], time.perf_counter() - queued)
+        outcome = "completed"
+        try:
+            yield preempted
+        except _Preempted:
+            outcome = "preempted"
+            raise
+        finally:
+            with self._cond:
+                del self._running[entry]
+                self.counts[outcome] += 1
+                self._cond.notify_all()
+
+    def _preempt_background(self):
+        # Die niedrigste laufende Hintergrundanfrage abbrechen (nur eine pro fehlendem Slot)
+        background = [(p, e) for p, e in self._running.values() if p > INTERACTIVE]
+        if not background or any(e.is_set() for _p, e in background):
+            return
+        max(background, key=lambda item: item[0])[1].set()
+
+    def invoke(self, chain, inputs: dict, priority: int = CONSOLIDATION, key: str = None, stale=None) -> str:
+        """Führt eine Kette mit der gegebenen Priorität aus.
+
+        Hintergrundanfragen werden gestreamt, damit sie bei einer Verdrängung mit dem
+        nächsten Token abbrechen; danach werden sie erneut eingereiht, außer `stale()`
+        meldet sie als veraltet (dann `Superseded`). `key` fasst gleichzeitige identische Anfragen
+        zusammen (Standard: Hash aus Kette und Eingaben).
+        """
+        if priority == INTERACTIVE:
+            with self.slot(priority):
+                return chain.invoke(inputs)
+
+        key = key or _input_key(chain, inputs)
+        with self._cond:
+            call = self._inflight.get(key)
+            if call is not None:
+                self.counts["coalesced"] += 1
+            else:
+                call = self._inflight[key] = _Call()
+        if call.owner is not threading.current_thread():
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_background(chain, inputs, priority, stale)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._cond:
+                self._inflight.pop(key, None)
+            call.done.set()
+
+    def _run_background(self, chain, inputs: dict, priority: int, stale=None) -> str:
+        while True:
+            self._drop_if_stale(stale)
+            try:
+                with self.slot(priority) as preempted:
+                    return self._stream(chain, inputs, preempted)
+            except _Preempted:
+                # Verdrängt: nur neu starten, wenn die Arbeit noch gebraucht wird
+                self._drop_if_stale(stale)
+
+    def _drop_if_stale(self, stale):
+        if stale is not None and stale():
+            with self._cond:
+                self.counts["dropped"] += 1
+            raise Superseded()
+
+    def _stream(self, chain, inputs: dict, preempted: threading.Event) -> str:
+        parts = []
+        stream = chain.stream(inputs)
+        try:
+            for chunk in stream:
+                if preempted.is_set():
+                    raise _Preempted()
+                parts.append(chunk)
+        finally:
+            # Schließen beendet die Anfrage an Ollama; erst danach wird der Slot frei
+            stream.close()
+        return "".join(parts)
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _seq in self._waiting:
+                depth[PRIORITY_NAMES[priority]] += 1
+            running = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _event in self._running.values():
+                running[PRIORITY_NAMES[priority]] += 1
+            counts = dict(self.counts)
+        wait = {name: metrics.quantiles("kabo_llm_wait_seconds", name) for name in PRIORITY_NAMES.values()}
+        return {
+            "slots": self.slots,
+            "queue_depth": depth,
+            "running": running,
+            "wait_seconds": {name: {f"p{int(q * 100)}": round(v, 4) for q, v in qs.items()}
+                             for name, qs in wait.items() if qs},
+            **counts,
+        }
+
+
+class Superseded(Exception):
+    """Hintergrundarbeit wurde verworfen, weil neuere Arbeit sie überflüssig macht."""
+
+
+class _Preempted(Exception):
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.owner = threading.current_thread()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _input_key(chain, inputs: dict) -> str:
+    # Die Kette (Prompt und Modellparameter) gehört dazu: gleiche Eingaben für
+    # verschiedene Prompts dürfen nicht zusammengefasst werden
+    text = "\x1f".join([repr(chain)] + [f"{k}={inputs[k]}" for k in sorted(inputs)])
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+dispatcher = LLMDispatcher()
@@ -0,0 +1,167 @@
+# core/embedders.py
+import json
+import os
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+# Embedding-Backend: "torch" (sentence-transformers) oder "onnx" (ONNX Runtime, int8)
+EMBEDDING_BACKEND = os.environ.get("KABO_EMBEDDING_BACKEND", "torch")
+# Texte pro Modellaufruf; größere Stapel lohnen sich vor allem beim Neuindizieren
+EMBEDDING_MODEL_BATCH = int(os.environ.get("KABO_EMBEDDING_MODEL_BATCH", "64"))
+ONNX_QUANTIZE = os.environ.get("KABO_EMBEDDING_INT8", "1") == "1"
+# 0 = ONNX Runtime wählt selbst
+ONNX_THREADS = int(os.environ.get("KABO_EMBEDDING_THREADS", "0"))
+# all-MiniLM-L6-v2 wurde mit höchstens 256 Tokens trainiert
+MAX_SEQ_LENGTH = 256
+# Mindest-Kosinus zwischen ONNX- und Torch-Vektoren; darunter bleibt es bei Torch
+VALIDATION_MIN_COSINE = 0.98
+VALIDATION_FILE = "validation.json"
+VALIDATION_TEXTS = [
+    "Hallo Kabo, wie geht es dir heute?",
+    "Pascal hat heute den ganzen Nachmittag an seinem Python-Projekt gearbeitet.",
+    "Wir haben über Musik gesprochen, vor allem über alte Jazz-Platten.",
+    "Morgen ist ein Arzttermin um zehn Uhr.",
+    "Kabo war traurig, weil Pascal lange nicht da war.",
+    "Das Wetter im Herbst ist kühl und regnerisch.",
+    "Er mag keine Pilze, aber Kürbissuppe isst er gern.",
+    "Kurz.",
+]
+
+
+def create_backend(backend: str, model_name: str, model_dir: str, batch_size: int = EMBEDDING_MODEL_BATCH,
+                   threads: int = ONNX_THREADS, validate_onnx: bool = True):
+    """Liefert (Embeddings, Variante); die Variante trennt die Embedding-Caches der Backends."""
+    if backend == "onnx":
+        # Fehlende Pakete, gescheiterter Export/Quantisierung oder ORT-Fehler: zurück auf Torch
+        try:
+            onnx = OnnxEmbeddings(model_name, model_dir, batch_size=batch_size, threads=threads)
+            if not validate_onnx or _validated(onnx, model_name, model_dir, batch_size):
+                return onnx, f"{model_name}-onnx-{onnx.variant}"
+        except Exception as e:
+            print(f"⚠️ ONNX-Backend nicht verfügbar ({e}), nutze Torch.")
+    elif backend != "torch":
+        raise ValueError(f"Unbekanntes Embedding-Backend: {backend!r}")
+    return torch_embeddings(model_name, batch_size), model_name
+
+
+def torch_embeddings(model_name: str, batch_size: int = EMBEDDING_MODEL_BATCH) -> Embeddings:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"batch_size": batch_size},
+    )
+
+
+class OnnxEmbeddings(Embeddings):
+    """Satz-Embeddings über ONNX Runtime, optional mit int8-quantisierten Gewichten.
+
+    Das Modell wird beim ersten Start exportiert und quantisiert und danach aus
+    `model_dir` geladen. Pooling und Normierung entsprechen sentence-transformers
+    (Mittelwert über die Attention-Maske, L2-normiert). Texte werden nach Länge
+    sortiert gestapelt, damit möglichst wenig Padding mitgerechnet wird.
+    """
+
+    def __init__(self, model_name: str, model_dir: str, quantize: bool = ONNX_QUANTIZE,
+                 batch_size: int = EMBEDDING_MODEL_BATCH, threads: int = ONNX_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        self.model_path = export_onnx(model_name, model_dir, quantize)
+        self.variant = "int8" if quantize else "fp32"
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                     max_length=MAX_SEQ_LENGTH, return_tensors="np")
+            feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self._input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for i, vector in zip(batch, pooled):
+                result[i] = vector.tolist()
+        return result
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def export_onnx(model_name: str, model_dir: str, quantize: bool = ONNX_QUANTIZE) -> str:
+    """Exportiert das Modell einmalig nach `model_dir` (fp32 und ggf. int8); liefert den Modellpfad."""
+    os.makedirs(model_dir, exist_ok=True)
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+        model_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        print(f"📦 Exportiere {model_id} nach ONNX...")
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model = AutoModel.from_pretrained(model_id).eval()
+        model.config.return_dict = False
+        probe = tokenizer(["dimension probe"], return_tensors="pt")
+        names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in probe]
+        tmp_path = fp32_path + ".tmp"
+        # no_grad statt inference_mode: Inferenz-Tensoren stören das Tracing
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(probe[n] for n in names), tmp_path,
+                input_names=names,
+                output_names=["last_hidden_state"],
+                dynamic_axes={**{n: {0: "batch", 1: "sequence"} for n in names},
+                              "last_hidden_state": {0: "batch", 1: "sequence"}},
+                opset_version=14,
+            )
+        tokenizer.save_pretrained(model_dir)
+        os.replace(tmp_path, fp32_path)
+    if not quantize:
+        return fp32_path
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print("⚙️ Quantisiere Embedding-Modell (int8)...")
+        tmp_path = int8_path + ".tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    return int8_path
+
+
+def validate(candidate: Embeddings, reference: Embeddings, texts: List[str] = VALIDATION_TEXTS) -> float:
+    """Kleinster Kosinus zwischen den Vektoren beider Backends für dieselben Texte."""
+    import numpy as np
+    a = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    b = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12)
+    return float(cosine.min())
+
+
+def _validated(onnx: OnnxEmbeddings, model_name: str, model_dir: str, batch_size: int) -> bool:
+    # Ergebnis pro Modelldatei merken; der Vergleich lädt einmalig das Torch-Modell
+    path = os.path.join(model_dir, VALIDATION_FILE)
+    stamp = f"{os.path.basename(onnx.model_path)}:{os.path.getmtime(onnx.model_path)}"
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        results = {}
+    min_cosine = results.get(stamp)
+    if min_cosine is None:
+        min_cosine = validate(onnx, torch_embeddings(model_name, batch_size))
+        results[stamp] = min_cosine
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f)
+    if min_cosine < VALIDATION_MIN_COSINE:
+        print(f"⚠️ ONNX-Embeddings weichen ab (min. Kosinus {min_cosine:.4f} < {VALIDATION_MIN_COSINE}), nutze Torch.")
+        return False
+    return True
@@ -0,0 +1,162 @@
+# core/episodes.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    topic TEXT,
+    mood TEXT,
+    session TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_episodes_title ON episodes(title);
+CREATE INDEX IF NOT EXISTS idx_episodes_topic ON episodes(topic, created_at);
+CREATE INDEX IF NOT EXISTS idx_episodes_mood ON episodes(mood, created_at);
+CREATE INDEX IF NOT EXISTS idx_episodes_session ON episodes(session, created_at);
+CREATE INDEX IF NOT EXISTS idx_episodes_created ON episodes(created_at);
+
+CREATE TABLE IF NOT EXISTS episode_messages (
+    episode_id INTEGER NOT NULL REFERENCES episodes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    message_id TEXT NOT NULL,
+    PRIMARY KEY (episode_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_episode_messages_message ON episode_messages(message_id);
+"""
+
+_COLUMNS = ("id", "title", "summary", "topic", "mood", "session", "created_at")
+
+
+class EpisodeStore:
+    """Episodisches Gedächtnis in SQLite (WAL-Modus).
+
+    Jede Episode wird mit einer einzelnen INSERT-Transaktion gespeichert und mit den
+    IDs ihrer Quellnachrichten verknüpft. Abfragen laufen über indizierte Spalten
+    und sind seitenweise (limit/offset).
+    """
+
+    def __init__(self, path: str, legacy_path: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        if legacy_path and os.path.exists(legacy_path):
+            self._migrate(legacy_path)
+
+    def add(self, title: str, summary: str, topic: str = None, mood: str = None, session: str = None,
+            message_ids: List[str] = None, created_at: float = None) -> int:
+        return self.add_many([{
+            "title": title, "summary": summary, "topic": topic, "mood": mood,
+            "session": session, "message_ids": message_ids, "created_at": created_at,
+        }])[0]
+
+    def add_many(self, episodes: List[dict]) -> List[int]:
+        ids = []
+        with self._lock, self._conn:
+            for episode in episodes:
+                cursor = self._conn.execute(
+                    "INSERT INTO episodes (title, summary, topic, mood, session, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (episode["title"], episode["summary"], episode.get("topic"), episode.get("mood"),
+                     episode.get("session"), episode.get("created_at") or time.time()),
+                )
+                episode_id = cursor.lastrowid
+                message_ids = [m for m in episode.get("message_ids") or [] if m is not None]
+                self._conn.executemany(
+                    "INSERT INTO episode_messages (episode_id, position, message_id) VALUES (?, ?, ?)",
+                    [(episode_id, i, str(m)) for i, m in enumerate(message_ids)],
+                )
+                ids.append(episode_id)
+        return ids
+
+    def query(self, topic: str = None, mood: str = None, session: str = None, title: str = None,
+              since: float = None, until: float = None, limit: Optional[int] = 20, offset: int = 0,
+              newest_first: bool = True) -> List[dict]:
+        where, params = self._where(topic, mood, session, title, since, until)
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM episodes{where} ORDER BY created_at {'DESC' if newest_first else 'ASC'}, id"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def count(self, topic: str = None, mood: str = None, session: str = None, title: str = None,
+              since: float = None, until: float = None) -> int:
+        where, params = self._where(topic, mood, session, title, since, until)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM episodes{where}", params).fetchone()[0]
+
+    def get(self, episode_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM episodes WHERE id = ?", (episode_id,)).fetchone()
+        return dict(row) if row else None
+
+    def message_ids(self, episode_id: int) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message_id FROM episode_messages WHERE episode_id = ? ORDER BY position", (episode_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def episodes_for_message(self, message_id: str) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT episode_id FROM episode_messages WHERE message_id = ?", (str(message_id),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[dict]:
+        # Seitenweise über alle Episoden (nach id), ohne alles auf einmal zu laden
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM episodes WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            last_id = rows[-1]["id"]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _where(self, topic, mood, session, title, since, until):
+        clauses, params = [], []
+        for column, value in (("topic", topic), ("mood", mood), ("session", session), ("title", title)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at <= ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _migrate(self, legacy_path: str):
+        # Einmalige Übernahme der alten episodic_memory.json
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        mtime = os.path.getmtime(legacy_path)
+        self.add_many([{
+            "title": item.get("title", ""),
+            "summary": item.get("summary", ""),
+            "topic": item.get("topic"),
+            "created_at": item.get("timestamp") or mtime,
+        } for item in data])
+        os.replace(legacy_path, legacy_path + ".migrated")
@@ -1,19 +1,36 @@
 # core/intelligents.py
-from langchain_core.runnables import RunnableLambda
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-from core.mind import build_chain, kabo_state, update_mood, update_topic, update_time_and_season
-from core.memory import save_memory, summarize_messages, save_episode, search_vectorstore
-from core.speak import KaboTTS, play_audio
+from core.mind import (build_chain, llm, state_classifier, kabo_state, new_state, update_mood, update_topic,
+                       update_time_and_season)
+from core.memory import (open_journal, load_memory, message_to_record, search_vectorstore, session_paths,
+                         embedding, vectorstore, episodes, MEMORY_LOG, ROLLING_SUMMARY_FILE)
+from core.consolidation import ConsolidationWorker
+from core.context import ContextBuilder
+from core.speak import get_tts, warm_up_tts, split_sentences, SpeechPipeline
+from core.playback import get_engine
+from core.tracing import span, record_tts
+from core.dispatch import dispatcher, INTERACTIVE
 from pathlib import Path
+import atexit
+
+VOICE_SAMPLE = Path("models/Kikuri_VA_Sample.wav")
 
 
 class SimpleMemory:
-    def __init__(self):
-        self.messages = []
+    def __init__(self, path: str = MEMORY_LOG):
+        self.journal = open_journal(path)
+        self.messages = load_memory(self.journal)
+        # Rückruf (position, message) nach jedem Speichern, z. B. für die Chat-Ansicht
+        self.on_add = None
 
-    def add_message(self, message):
+    def add_message(self, message) -> int:
         self.messages.append(message)
-        self._save()
+        # Nur die neue Nachricht wird ans Log angehängt (O(1) pro Nachricht)
+        message.id = str(self.journal.append(message_to_record(message)))
+        position = len(self.messages) - 1
+        if self.on_add is not None:
+            self.on_add(position, message)
+        return position
 
     def add_user_message(self, content):
         self.add_message(HumanMessage(content=content))
@@ -23,61 +40,210 @@ class SimpleMemory:
 
     def clear(self):
         self.messages = []
-        self._save()
+        self.journal.clear()
 
     def get_messages(self):
         return self.messages
 
-    def _save(self):
-        save_memory(self.messages)
+    def page(self, before: int = None, limit: int = 50):
+        """Bis zu `limit` Nachrichten vor Position `before` (None = Ende): ([(position, msg), ...], start, end)."""
+        end = len(self.messages) if before is None else max(0, min(before, len(self.messages)))
+        start = max(0, end - limit)
+        return [(start + i, msg) for i, msg in enumerate(self.messages[start:end])], start, end
+
+    def close(self):
+        self.journal.close()
 
 
 class KaboAI:
-    def __init__(self):
-        self.memory = SimpleMemory()
-        self.chain = build_chain(kabo_state)
+    def __init__(self, stream_speech: bool = True, session: str = None, consolidator: ConsolidationWorker = None,
+                 tts_enabled: bool = True):
+        # stream_speech: Sätze schon während der LLM-Generierung synthetisieren und abspielen
+        self.stream_speech = stream_speech
+        self.tts_enabled = tts_enabled
+        # Wiedergabefunktion (data, samplerate); None = Lautsprecher über sounddevice
+        self.player = None
+        # session: eigener Zustand, Verlauf und Episoden-Namensraum (Server); None = Desktop-App
+        self.session = session
+        if session is None:
+            self.state = kabo_state
+            self.memory = SimpleMemory()
+            summary_path = ROLLING_SUMMARY_FILE
+        else:
+            paths = session_paths(session)
+            self.state = new_state()
+            self.memory = SimpleMemory(paths["memory_log"])
+            summary_path = paths["rolling_summary"]
+        self._chain = None
+        # Begrenzt Verlauf + Fakten im Prompt auf ein Token-Budget
+        self.context = ContextBuilder(summary_path=summary_path)
+        self._fold_key = f"fold:{id(self.context)}"
+        # Episoden werden im Hintergrund gebündelt; beim Beenden wird alles Offene gespeichert.
+        # Der Server teilt einen Worker zwischen allen Sitzungen.
+        self._owns_consolidator = consolidator is None
+        self.consolidator = consolidator or ConsolidationWorker()
+        if session is None:
+            atexit.register(self.shutdown)
+
+    @property
+    def chain(self):
+        # Die Kette braucht das LLM und wird deshalb erst beim ersten Turn gebaut
+        if self._chain is None:
+            self._chain = build_chain(self.state)
+        return self._chain
+
+    def warm_up(self):
+        """Startet das Laden von LLM, Embeddings, Vektorstore, Episoden, Klassifikator und TTS im Hintergrund."""
+        llm.start()
+        embedding.start()
+        vectorstore.start()
+        episodes.start()
+        # Wartet im eigenen Thread auf die Embeddings
+        state_classifier.start()
+        warm_up_tts(audio_prompt_path=VOICE_SAMPLE)
 
     def update_state(self, user_input):
-        update_time_and_season()
-        update_mood(user_input)
-        update_topic(user_input)
-
-    def get_response(self, user_input):
-        self.update_state(user_input)
+        update_time_and_season(self.state)
+        update_mood(user_input, self.state)
+        update_topic(user_input, self.state)
+
+    def get_response(self, user_input, on_token=None, cancel=None):
+        """Erzeugt eine Antwort; on_token erhält gestreamte Textstücke, cancel (threading.Event) bricht ab."""
+        with span("turn", stream=self.stream_speech):
+            return self._respond(user_input, on_token, cancel)
+
+    def _respond(self, user_input, on_token=None, cancel=None):
+        with span("update_state") as s:
+            self.update_state(user_input)
+            s.set(mood=self.state["mood"], topic=self.state["topic"])
+
+        # Kopie: die aktuelle Eingabe steht als "User:" am Prompt-Ende, nicht im Verlauf
+        history = list(self.memory.get_messages())
+        with span("memory_append"):
+            self.memory.add_user_message(user_input)
+
+        with span("search_vectorstore") as s:
+            retrieved_facts = search_vectorstore(user_input, k=3, session=self.session)
+            s.set(results=len(retrieved_facts))
+        with span("context_build"):
+            inputs = {
+                **self.context.build(history, retrieved_facts),
+                "input": user_input,
+                **self.state
+            }
+
+        if self.stream_speech:
+            result = self._stream_reply(inputs, on_token, cancel)
+            if result is None:
+                return "Da ist etwas schiefgelaufen."
+            self.memory.add_ai_message(result)
+        else:
+            try:
+                with span("llm") as s:
+                    result = dispatcher.invoke(self.chain, inputs, priority=INTERACTIVE)
+                    s.set(chars=len(result))
+            except Exception as e:
+                print(f"Fehler beim LLM-Aufruf: {e}")
+                return "Da ist etwas schiefgelaufen."
+
+            if on_token:
+                on_token(result)
+            self.memory.add_ai_message(result)
+
+            if self.tts_enabled:
+                self._speak(result)
+
+        turn_messages: list[BaseMessage] = self.memory.get_messages()[-2:]
+        self.consolidator.submit_turn(self.state.get("topic", "something interesting"), turn_messages,
+                                      mood=self.state.get("mood"), session=self.session)
+        if self.context.has_pending():
+            # Verdrängte Nachrichten werden außerhalb des Antwortpfads zusammengefasst
+            self.consolidator.submit_job(self._fold_context, key=self._fold_key)
 
-        history = self.memory.get_messages()
-        self.memory.add_user_message(user_input)
+        return result
 
-        retrieved_facts = search_vectorstore(user_input, k=3)
-        context_info = "\n".join(retrieved_facts)
-        if context_info:
-            context_info = f"[Relevant Facts from Memory]\n{context_info}\n"
+    def _fold_context(self):
+        # Veraltet, sobald eine neuere Faltung wartet: die übernimmt dann alle offenen Nachrichten
+        self.context.fold_pending(stale=lambda: self.consolidator.is_queued(self._fold_key))
 
-        try:
-            result = self.chain.invoke({
-                "chat_history": history,
-                "input": user_input,
-                "context": context_info,
-                **kabo_state
-            })
-        except Exception as e:
-            print(f"Fehler beim LLM-Aufruf: {e}")
-            return "Da ist etwas schiefgelaufen."
+    def close(self):
+        # Nur die Ressourcen dieser Sitzung freigeben; geteilte Modelle bleiben geladen
+        if self._owns_consolidator:
+            self.consolidator.stop()
+        self.memory.close()
 
-        self.memory.add_ai_message(result)
+    def shutdown(self):
+        self.close()
+        if embedding.is_ready():
+            embedding.get().flush()
+        if episodes.is_ready():
+            episodes.get().close()
 
+    def _speak(self, text):
         try:
-            tts = KaboTTS(audio_prompt_path=Path("models/Kikuri_VA_Sample.wav"))
-            tts.speak(result)
-            play_audio(Path("core/output.wav"))
+            with span("tts_load"):
+                tts = get_tts(audio_prompt_path=VOICE_SAMPLE)
+            with span("tts_synthesize") as s:
+                wav = tts.synthesize(text)
+                audio_seconds = len(wav) / tts.sr
+                s.set(audio_seconds=round(audio_seconds, 3))
+            record_tts(s.duration, audio_seconds)
+            # Direkt aus dem Speicher abspielen, ohne Umweg über output.wav;
+            # ein gesetzter Player (Server, Benchmark) ersetzt die Soundkarte
+            with span("play_audio"):
+                if self.player is not None:
+                    self.player(wav, tts.sr)
+                else:
+                    engine = get_engine()
+                    engine.remember(wav, tts.sr)
+                    engine.play(wav, tts.sr)
         except Exception as e:
             print(f"TTS-Fehler: {e}")
 
-        recent_messages: list[BaseMessage] = self.memory.get_messages()[-10:]
-        if recent_messages:
-            topic = kabo_state.get("topic", "something interesting")
-            summary = summarize_messages(recent_messages)
-            save_episode(f"Conversation about {topic}", summary, recent_messages)
+    def _stream_reply(self, inputs, on_token=None, cancel=None):
+        # Die TTS wird erst im Synthese-Thread geholt, damit das LLM sofort starten kann
+        speech = None
+        if self.tts_enabled:
+            speech = SpeechPipeline(lambda: get_tts(audio_prompt_path=VOICE_SAMPLE), player=self.player)
+        parts = []
+
+        timing = {"first_token": None}
+
+        def tokens():
+            for chunk in self.chain.stream(inputs):
+                if cancel is not None and cancel.is_set():
+                    # Generator schließen beendet auch die Anfrage an Ollama
+                    if speech is not None:
+                        speech.cancel()
+                    return
+                if timing["first_token"] is None:
+                    timing["first_token"] = llm_span.elapsed()
+                parts.append(chunk)
+                if on_token:
+                    on_token(chunk)
+                yield chunk
 
-        return result
+        try:
+            # Hat ein Slot Vorrang, wird laufende Hintergrund-Zusammenfassung verdrängt
+            with dispatcher.slot(INTERACTIVE), span("llm") as llm_span:
+                if speech is None:
+                    for _chunk in tokens():
+                        pass
+                else:
+                    for sentence in split_sentences(tokens()):
+                        speech.feed(sentence)
+                # Tokens/s und Zeit bis zum ersten Token erfasst der Callback am Modell (prompt_stats)
+                llm_span.set(chunks=len(parts), first_token_ms=round((timing["first_token"] or 0) * 1000, 1))
+        except Exception as e:
+            print(f"Fehler beim LLM-Aufruf: {e}")
+            if speech is not None:
+                speech.close()
+            return None
+
+        if speech is None:
+            return "".join(parts)
+        with span("speech_drain"):
+            # Die Antwort bleibt für den "Play Audio"-Button im Speicher der AudioEngine
+            speech.close(cancel)
+        return "".join(parts)
 
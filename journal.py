@@ -0,0 +1,164 @@
+# core/journal.py
+import json
+import os
+import threading
+import time
+from typing import Iterator, List
+
+# fsync nach so vielen Einträgen bzw. spätestens nach so vielen Sekunden
+FSYNC_EVERY = 16
+FSYNC_INTERVAL = 2.0
+# Ab so vielen toten Einträgen (vor dem letzten "clear") wird beim Öffnen kompaktiert
+COMPACT_MIN_DEAD = 1000
+
+
+class MessageJournal:
+    """Append-only JSONL-Log für den Gesprächsverlauf.
+
+    Jede Nachricht ist eine Zeile; ein "clear" wird ebenfalls nur angehängt.
+    Beim Öffnen wird ein abgeschnittener letzter Eintrag (Absturz mitten im
+    Schreiben) verworfen, und tote Einträge werden bei Bedarf kompaktiert.
+    """
+
+    def __init__(self, path: str, legacy_path: str = None,
+                 fsync_every: int = FSYNC_EVERY, fsync_interval: float = FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._file = None
+        self._live_offset = 0
+        self._live_count = 0
+        self._dead_count = 0
+        self.next_id = 0
+
+        if legacy_path and not os.path.exists(path) and os.path.exists(legacy_path):
+            self._migrate(legacy_path)
+
+        self._recover()
+        if self._dead_count >= COMPACT_MIN_DEAD:
+            self.compact()
+        else:
+            self._file = open(self.path, "ab")
+
+    def __len__(self):
+        return self._live_count
+
+    def _recover(self):
+        if not os.path.exists(self.path):
+            return
+        good_end = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # halb geschriebener letzter Eintrag
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(f"Beschädigter Journal-Eintrag übersprungen ({self.path})")
+                    good_end += len(line)
+                    continue
+                good_end += len(line)
+                if record.get("op") == "clear":
+                    self._dead_count += self._live_count + 1
+                    self._live_count = 0
+                    self._live_offset = good_end
+                else:
+                    self._live_count += 1
+                    self.next_id = max(self.next_id, record.get("id", -1) + 1)
+
+        if good_end < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+                os.fsync(f.fileno())
+
+    def _migrate(self, legacy_path: str):
+        # Einmalige Übernahme der alten longterm_memory.json
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for i, item in enumerate(data):
+            item.setdefault("id", i)
+        self._write_snapshot(data)
+        os.replace(legacy_path, legacy_path + ".bak")
+
+    def records(self) -> Iterator[dict]:
+        """Streamt alle gültigen Einträge seit dem letzten "clear"."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            offset = self._live_offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("op") != "clear":
+                    yield record
+
+    def append(self, record: dict) -> int:
+        with self._lock:
+            record = dict(record, id=self.next_id)
+            self.next_id += 1
+            self._write_line(record)
+            self._live_count += 1
+            return record["id"]
+
+    def clear(self):
+        with self._lock:
+            self._write_line({"op": "clear"})
+            self._file.flush()
+            self._dead_count += self._live_count + 1
+            self._live_count = 0
+            self._live_offset = self._file.tell()
+
+    def compact(self, records: List[dict] = None):
+        """Schreibt nur die lebenden Einträge (oder `records`) atomar in ein neues Log."""
+        if records is None:
+            records = list(self.records())
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._write_snapshot(records)
+            self._live_offset = 0
+            self._live_count = len(records)
+            self._dead_count = 0
+            self._file = open(self.path, "ab")
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def _write_line(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        # flush reicht gegen Prozessabstürze; fsync wird gebündelt
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._sync()
+
+    def _sync(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _write_snapshot(self, records: List[dict]):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        next_id = max((r.get("id", -1) for r in records), default=-1) + 1
+        self.next_id = max(self.next_id, next_id)
@@ -1,29 +1,69 @@
 # kabocha_ui.py
 import sys
 import os
-import time
-import subprocess
-import random
+import threading
+from collections import deque
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QTextEdit, QLineEdit, QPushButton,
-    QVBoxLayout, QHBoxLayout, QMainWindow
+    QApplication, QWidget, QLineEdit, QPushButton,
+    QVBoxLayout, QHBoxLayout, QLabel
 )
 from PyQt5.QtWebEngineWidgets import QWebEngineView
-from PyQt5.QtCore import QUrl, qInstallMessageHandler, QtMsgType
+from PyQt5.QtCore import QUrl, QTimer, QThread, pyqtSignal, qInstallMessageHandler, QtMsgType
+from langchain_core.messages import HumanMessage, AIMessage
+from core import lazy, tracing
 from core.intelligents import KaboAI
-from core.speak import play_audio
+from core.speak import play_audio, replay_last, OUTPUT_PATH
+from core.playback import get_engine
+from core.assetserver import AssetServer
+from core.chatview import ChatView
+
+lazy.mark("imports done")
 
 print("Aktives Python:", sys.executable)
 
+
+class TurnWorker(QThread):
+    """Führt einen Gesprächsturn (LLM, TTS, Wiedergabe) abseits des Qt-Hauptthreads aus."""
+    token = pyqtSignal(str)
+    reply_finished = pyqtSignal(str)
+
+    def __init__(self, kabo, user_input, parent=None):
+        super().__init__(parent)
+        self.kabo = kabo
+        self.user_input = user_input
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        try:
+            reply = self.kabo.get_response(self.user_input, on_token=self.token.emit, cancel=self.cancel_event)
+        except Exception as e:
+            print(f"Fehler im Gesprächsturn: {e}")
+            reply = "Da ist etwas schiefgelaufen."
+        self.reply_finished.emit(reply)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
 class KaboUI(QWidget):
+    # Gedächtnis-Position einer gerade gespeicherten Nachricht (aus dem TurnWorker-Thread)
+    message_stored = pyqtSignal(int)
+
     def __init__(self):
         super().__init__()
         self.kabo = KaboAI()
+        self.worker = None
+        self.pending_inputs = []
+        self.reply_key = None
+        # Zeilen des laufenden Turns in Speicherreihenfolge: Nutzernachricht, dann Antwort
+        self.unstored = deque()
+        self.message_stored.connect(self.on_message_stored)
+        self.kabo.memory.on_add = lambda position, _message: self.message_stored.emit(position)
         self.init_ui()
 
     def init_ui(self):
-        self.chat_box = QTextEdit()
-        self.chat_box.setReadOnly(True)
+        # Zeichnet nur sichtbare Nachrichten; ältere werden beim Hochscrollen aus dem Gedächtnis geladen
+        self.chat_view = ChatView(page_loader=self.load_history_page)
 
         self.input_line = QLineEdit()
         self.input_line.setPlaceholderText("Message...")
@@ -32,47 +72,135 @@ class KaboUI(QWidget):
         self.speak_btn = QPushButton("Say something...")
         self.speak_btn.clicked.connect(self.handle_speech_input)
 
+        self.status_label = QLabel("")
+
         self.tts_btn = QPushButton("Play Audio")
         self.tts_btn.clicked.connect(self.play_tts)
 
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.clicked.connect(self.cancel_reply)
+        self.stop_btn.setEnabled(False)
+
         btn_layout = QHBoxLayout()
         btn_layout.addWidget(self.speak_btn)
         btn_layout.addWidget(self.tts_btn)
+        btn_layout.addWidget(self.stop_btn)
 
         layout = QVBoxLayout()
-        layout.addWidget(self.chat_box)
+        layout.addWidget(self.chat_view)
+        layout.addWidget(self.status_label)
         layout.addWidget(self.input_line)
         layout.addLayout(btn_layout)
 
         self.setLayout(layout)
+        self.chat_view.load_initial()
+
+    def load_history_page(self, before, limit):
+        items, start, end = self.kabo.memory.page(before, limit)
+        messages = []
+        for position, msg in items:
+            if isinstance(msg, HumanMessage):
+                messages.append(("user", msg.content, position))
+            elif isinstance(msg, AIMessage):
+                messages.append(("kabo", msg.content, position))
+        return messages, start, end
+
+    def start_background_init(self):
+        # Modelle laden, nachdem das Fenster sichtbar ist; Eingaben sind sofort möglich
+        self.kabo.warm_up()
+        self.init_timer = QTimer(self)
+        self.init_timer.timeout.connect(self.update_init_status)
+        self.init_timer.start(200)
+        self.update_init_status()
+
+    def update_init_status(self):
+        loading = lazy.pending()
+        if loading:
+            self.status_label.setText("Lädt: " + ", ".join(loading))
+            return
+        self.status_label.setText("")
+        self.init_timer.stop()
+        print(lazy.startup_report())
 
     def handle_text_input(self):
         user_input = self.input_line.text().strip()
         if user_input:
-            self.chat_box.append(f"<p style='color:#c8d2bb'><b>Pascal:</b> {user_input}</p><div style='margin-bottom:5px'></div>")
+            key = self.chat_view.add_message("user", user_input)
             self.input_line.clear()
-
-            response = self.get_llm_response(user_input)
-            self.chat_box.append(f"<p style='color:#a1446c'><b>Kabo-chan:</b> {response}</p><div style='margin-bottom:10px'></div>")
+            self.submit(user_input, key)
 
     def handle_speech_input(self):
         user_input = "Platzhalter (STT Ergebnis)"
-        self.chat_box.append(f"<b>Pascal:</b> {user_input}</p><br")
+        key = self.chat_view.add_message("user", user_input)
+        self.submit(user_input, key)
+
+    def submit(self, user_input, key):
+        # Barge-in: eine neue Nachricht bricht die laufende Antwort samt Wiedergabe sofort ab;
+        # der bisher erzeugte Text bleibt erhalten, die neue Nachricht folgt direkt danach
+        if self.worker is not None:
+            self.worker.cancel()
+            get_engine().interrupt()
+            self.pending_inputs.append((user_input, key))
+            return
+        self.start_reply(user_input, key)
+
+    def start_reply(self, user_input, user_key):
+        # Während der Antwort getippte Nachrichten stehen darunter; Tokens gehen gezielt in diese Zeile
+        self.reply_key = self.chat_view.add_message("kabo")
+        # Im Gedächtnis folgt jede Antwort direkt auf ihre Nachricht, auch wenn die Ansicht abweicht
+        self.unstored = deque([user_key, self.reply_key])
+        self.streamed = False
+        self.worker = TurnWorker(self.kabo, user_input, self)
+        self.worker.token.connect(self.append_token)
+        self.worker.reply_finished.connect(self.finish_reply)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.stop_btn.setEnabled(True)
+        self.worker.start()
+
+    def append_token(self, token):
+        self.streamed = True
+        self.chat_view.append_text(token, self.reply_key)
 
-        response = self.get_llm_response(user_input)
-        self.chat_box.append(f"<b>Kabo-chan:</b> {response}</p><br")
+    def finish_reply(self, reply):
+        if not self.streamed:
+            self.append_token(reply)
+        self.worker = None
+        self.stop_btn.setEnabled(False)
+        if self.pending_inputs:
+            self.start_reply(*self.pending_inputs.pop(0))
+
+    def on_message_stored(self, position):
+        # Eine nie gespeicherte Antwort (LLM-Fehler) bleibt ohne Position
+        if self.unstored:
+            self.chat_view.set_position(self.unstored.popleft(), position)
+
+    def cancel_reply(self):
+        if self.worker is not None:
+            self.worker.cancel()
+        get_engine().interrupt()
+
+    def shutdown(self):
+        self.pending_inputs = []
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait(5000)
+        self.kabo.shutdown()
+        get_engine().close()
 
     def get_llm_response(self, text):
         return self.kabo.get_response(text)
 
     def play_tts(self):
         print("TTS wird erneut abgespielt...")
-        play_audio(os.path.join("core", "output.wav"))
+        # Letzte Antwort aus dem Speicher; die Datei nur, falls in dieser Sitzung noch nichts gesprochen wurde
+        if not replay_last() and os.path.exists(OUTPUT_PATH):
+            threading.Thread(target=play_audio, args=(OUTPUT_PATH,), daemon=True).start()
 
 
 class MainWindow(QWidget):
-    def __init__(self):
+    def __init__(self, assets: AssetServer):
         super().__init__()
+        self.assets = assets
         self.setWindowTitle("Kabo-chan AI")
         self.setGeometry(200, 200, 900, 2160)
         self.init_ui()
@@ -83,8 +211,10 @@ class MainWindow(QWidget):
         # Unity-WebView oben
         self.web_view = QWebEngineView()
         self.web_view.setFixedSize(900, 900)
-        url = f"http://localhost:8000?cache_buster={random.randint(0, 999999)}"
-        self.web_view.load(QUrl(url))
+        # Seite laden, sobald der Asset-Server bereit ist (statt fest zu warten)
+        self.server_timer = QTimer(self)
+        self.server_timer.timeout.connect(self.load_avatar_when_ready)
+        self.server_timer.start(50)
         self.web_view.page().settings().setAttribute(
         self.web_view.page().settings().ShowScrollBars, False
         )
@@ -101,6 +231,14 @@ class MainWindow(QWidget):
 
         self.setLayout(layout)
 
+    def load_avatar_when_ready(self):
+        if not self.assets.ready.is_set():
+            return
+        self.server_timer.stop()
+        # Die URL enthält den Build-Hash: unveränderte Builds kommen aus dem Browser-Cache
+        self.web_view.load(QUrl(self.assets.url))
+        lazy.mark("avatar requested")
+
 def suppress_qt_warnings(msg_type, msg_log_context, msg_string):
     if msg_type == QtMsgType.QtDebugMsg and "js:" in msg_string:
         return  # Unterdrückt JavaScript-Logs
@@ -110,16 +248,15 @@ def suppress_qt_warnings(msg_type, msg_log_context, msg_string):
 qInstallMessageHandler(suppress_qt_warnings)
 
 if __name__ == "__main__":
-    # WebGL-Server starten
+    # Asset-Server für den WebGL-Build im selben Prozess starten (eigener Thread)
     unity_webgl_path = os.path.expanduser("~/Kabocha_AI/models/UnityWebGLBuild")
-    server_process = subprocess.Popen(
-        ["python3", "-m", "http.server", "8000"],
-        cwd=unity_webgl_path,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL
-    )
-    time.sleep(1)
+    assets = AssetServer(unity_webgl_path).start()
     app = QApplication(sys.argv)
+    try:
+        # Prometheus-Metriken und p50/p95 pro Stufe unter http://127.0.0.1:9464/metrics bzw. /stats
+        tracing.serve_metrics()
+    except OSError as e:
+        print(f"Metrik-Server nicht gestartet: {e}")
 
     dark_stylesheet = """
     QWidget {
@@ -142,7 +279,7 @@ if __name__ == "__main__":
         background-color: #2A2A2A;
     }
 
-    QLineEdit, QTextEdit {
+    QLineEdit, QTextEdit, QListView {
         background-color: #1E1E1E;
         color: #FFFFFF;
         border: 1px solid #444444;
@@ -153,9 +290,13 @@ if __name__ == "__main__":
 """
     app.setStyleSheet(dark_stylesheet)
 
-    window = MainWindow()
+    window = MainWindow(assets)
     window.show()
+    lazy.mark("window shown")
+    QTimer.singleShot(0, window.kabo_ui.start_background_init)
+    # Offene Episoden vor dem Beenden noch speichern
+    app.aboutToQuit.connect(window.kabo_ui.shutdown)
     exit_code = app.exec_()
 
-    server_process.terminate()
+    assets.stop()
     sys.exit(exit_code)
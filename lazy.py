@@ -0,0 +1,90 @@
+# core/lazy.py
+import threading
+import time
+
+# Referenzzeitpunkt für den Startbericht (dieses Modul wird sehr früh importiert)
+T0 = time.perf_counter()
+
+_registry = {}
+_marks = []
+
+
+class Lazy:
+    """Thread-sicherer Singleton, der erst bei Bedarf (oder im Hintergrund) erzeugt wird.
+
+    `ready` ist ein threading.Event, das gesetzt wird, sobald das Objekt bereitsteht.
+    Ein Aufruf von get() während eines laufenden Hintergrund-Ladevorgangs wartet darauf,
+    statt das Objekt ein zweites Mal zu erzeugen.
+    """
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self.factory = factory
+        self.ready = threading.Event()
+        self.error = None
+        self.started_at = None
+        self.load_seconds = None
+        self._value = None
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def get(self, *args, **kwargs):
+        if self.ready.is_set():
+            return self._value
+        with self._lock:
+            if not self.ready.is_set():
+                self.started_at = time.perf_counter()
+                value = self.factory(*args, **kwargs)
+                self.load_seconds = time.perf_counter() - self.started_at
+                self._value = value
+                self.error = None
+                self.ready.set()
+        return self._value
+
+    def override(self, value):
+        # Fertiges Objekt einsetzen (z. B. lokale Attrappen in Benchmarks)
+        with self._lock:
+            self._value = value
+            self.started_at = time.perf_counter()
+            self.load_seconds = 0.0
+            self.error = None
+            self.ready.set()
+
+    def start(self, *args, **kwargs) -> threading.Thread:
+        # Im Hintergrund laden; Fehler werden gemerkt und beim nächsten get() erneut versucht
+        def _run():
+            try:
+                self.get(*args, **kwargs)
+            except Exception as e:
+                self.error = e
+                print(f"Laden von '{self.name}' fehlgeschlagen: {e}")
+
+        thread = threading.Thread(target=_run, name=f"init-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self) -> bool:
+        return self.ready.is_set()
+
+
+def mark(label: str):
+    # Zeitpunkt einer Startphase festhalten (z. B. "window shown")
+    _marks.append((label, time.perf_counter() - T0))
+
+
+def pending() -> list:
+    return [name for name, item in _registry.items() if not item.is_ready() and item.error is None]
+
+
+def startup_report() -> str:
+    lines = ["Startzeit-Aufschlüsselung:"]
+    for label, at in _marks:
+        lines.append(f"  {label:<24} bei {at:7.2f}s")
+    for name, item in _registry.items():
+        if item.load_seconds is not None:
+            lines.append(f"  {name:<24} ab {item.started_at - T0:7.2f}s, Dauer {item.load_seconds:6.2f}s")
+        elif item.error is not None:
+            lines.append(f"  {name:<24} Fehler: {item.error}")
+        else:
+            lines.append(f"  {name:<24} nicht geladen")
+    return "\n".join(lines)
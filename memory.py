@@ -1,72 +1,269 @@
 # core/memory.py
 import json
 import os
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
 from typing import List
+import numpy as np
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
-from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 from core.mind import llm
+from core.dispatch import dispatcher, CONSOLIDATION, MAINTENANCE
+from core.lazy import Lazy
+from core.journal import MessageJournal
+from core.vectorindex import SegmentedVectorStore
+from core.retrieval import hybrid_search
+from core.episodes import EpisodeStore
+from core.embedders import EMBEDDING_BACKEND, create_backend
 
-# Pfade & Parameter
-MEMORY_FILE = os.path.join(os.path.dirname(__file__), "longterm_memory.json")
-EPISODIC_FILE = os.path.join(os.path.dirname(__file__), "episodic_memory.json")
-VECTORSTORE_PATH = os.path.join(os.path.dirname(__file__), "vectorstore")
+# Pfade & Parameter (KABO_DATA_DIR lenkt alle Dateien z. B. für Benchmarks um)
+DATA_DIR = os.environ.get("KABO_DATA_DIR", os.path.dirname(__file__))
+MEMORY_FILE = os.path.join(DATA_DIR, "longterm_memory.json")
+MEMORY_LOG = os.path.join(DATA_DIR, "longterm_memory.jsonl")
+EPISODIC_FILE = os.path.join(DATA_DIR, "episodic_memory.json")
+EPISODE_DB = os.path.join(DATA_DIR, "episodic_memory.db")
+VECTORSTORE_PATH = os.path.join(DATA_DIR, "vectorstore")
+ROLLING_SUMMARY_FILE = os.path.join(DATA_DIR, "rolling_summary.json")
+EMBEDDING_CACHE_DIR = os.path.join(DATA_DIR, "embedding_cache")
+# Exportierte ONNX-Modelle (siehe core.embedders)
+ONNX_MODEL_DIR = os.path.join(DATA_DIR, "onnx_models")
+# Verlauf und Kontext-Zusammenfassung je Server-Sitzung
+SESSIONS_DIR = os.path.join(DATA_DIR, "sessions")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 SUMMARY_LIMIT = 20
+# Anzahl gecachter Embeddings (LRU) und Stapelgröße für embed_documents
+EMBEDDING_CACHE_SIZE = 50000
+EMBEDDING_BATCH_SIZE = 64
 
-# Embedding-Modell für Vektorstore
-embedding = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2",
-    model_kwargs={"device": "cpu"}
-)
-
-# Vektorstore initialisieren
-if os.path.exists(VECTORSTORE_PATH):
-    vectorstore = FAISS.load_local(
-        VECTORSTORE_PATH,
-        embedding,
-        allow_dangerous_deserialization=True
-    )
-else:
-    # Leerer Vektorstore bei Erststart
-    vectorstore = FAISS.from_documents([], embedding)
-    vectorstore.save_local(VECTORSTORE_PATH)
-
-# Retriever erzeugen
-retriever = vectorstore.as_retriever()
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def session_paths(session: str) -> dict:
+    """Dateipfade einer Sitzung; Episoden und Vektoren teilen sich alle, getrennt über die Sitzungs-ID."""
+    if not _SESSION_ID.match(session):
+        raise ValueError(f"Ungültige Sitzungs-ID: {session!r}")
+    folder = os.path.join(SESSIONS_DIR, session)
+    os.makedirs(folder, exist_ok=True)
+    return {
+        "memory_log": os.path.join(folder, "longterm_memory.jsonl"),
+        "rolling_summary": os.path.join(folder, "rolling_summary.json"),
+    }
+
+
+# Embedding-Cache vor dem eigentlichen Modell
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+    """LRU-Cache für Embeddings, Schlüssel ist der Hash des normalisierten Texts.
+
+    Die Vektoren liegen in einer memory-mapped float32-Matrix (vectors.f32), die
+    Zuordnung Hash -> Zeile in einem Append-only-Index (index.log). Alle Cache-Misses
+    eines Aufrufs werden dedupliziert und gebündelt an embed_documents übergeben.
+    MiniLM bettet Anfragen und Dokumente gleich ein, daher teilen sie sich den Cache.
+    """
+
+    def __init__(self, base: Embeddings, cache_dir: str, capacity: int = EMBEDDING_CACHE_SIZE,
+                 batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.base = base
+        self.cache_dir = cache_dir
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._slots = OrderedDict()  # Hash -> Zeile, in LRU-Reihenfolge
+        self._vectors = None
+        self._index_file = None
+        self._index_lines = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._slots and key not in found:
+                    self._slots.move_to_end(key)
+                    found[key] = np.array(self._vectors[self._slots[key]])
+        missing = OrderedDict()
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - sum(1 for k in keys if k in missing)
+        self.misses += len(missing)
+
+        if missing:
+            miss_keys = list(missing)
+            miss_texts = list(missing.values())
+            for start in range(0, len(miss_texts), self.batch_size):
+                vectors = self.base.embed_documents(miss_texts[start:start + self.batch_size])
+                for key, vector in zip(miss_keys[start:start + self.batch_size], vectors):
+                    found[key] = np.asarray(vector, dtype=np.float32)
+            with self._lock:
+                for key in miss_keys:
+                    self._store(key, found[key])
+                self._index_file.flush()
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def flush(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            if self._index_file is not None:
+                self._index_file.flush()
+                os.fsync(self._index_file.fileno())
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+    def _store(self, key: str, vector: np.ndarray):
+        if self._vectors is None:
+            self._open_vectors(vector.shape[0])
+        if key in self._slots:
+            slot = self._slots[key]
+            self._slots.move_to_end(key)
+        elif len(self._slots) < self.capacity:
+            slot = len(self._slots)
+            self._slots[key] = slot
+        else:
+            # Ältesten Eintrag verdrängen und seine Zeile wiederverwenden
+            _old_key, slot = self._slots.popitem(last=False)
+            self._slots[key] = slot
+        self._vectors[slot] = vector
+        self._index_file.write(f"{key} {slot}\n")
+        self._index_lines += 1
+        if self._index_lines > 2 * self.capacity:
+            self._compact_index()
+
+    def _open_vectors(self, dim: int):
+        path = os.path.join(self.cache_dir, "vectors.f32")
+        with open(os.path.join(self.cache_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": dim, "capacity": self.capacity}, f)
+        mode = "r+" if os.path.exists(path) else "w+"
+        self._vectors = np.memmap(path, dtype=np.float32, mode=mode, shape=(self.capacity, dim))
+
+    def _load(self):
+        meta_path = os.path.join(self.cache_dir, "meta.json")
+        index_path = os.path.join(self.cache_dir, "index.log")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("capacity") != self.capacity:
+                # Andere Größe: Cache verwerfen statt umzusortieren
+                for name in ("vectors.f32", "index.log", "meta.json"):
+                    if os.path.exists(os.path.join(self.cache_dir, name)):
+                        os.remove(os.path.join(self.cache_dir, name))
+            else:
+                self._open_vectors(meta["dim"])
+        if self._vectors is not None and os.path.exists(index_path):
+            owner = {}  # Zeile -> Hash; spätere Einträge überschreiben frühere
+            with open(index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1].isdigit() and int(parts[1]) < self.capacity:
+                        owner.pop(int(parts[1]), None)
+                        owner[int(parts[1])] = parts[0]
+                    self._index_lines += 1
+            for slot, key in owner.items():
+                self._slots.pop(key, None)
+                self._slots[key] = slot
+        self._index_file = open(index_path, "a", encoding="utf-8")
+
+    def _compact_index(self):
+        index_path = os.path.join(self.cache_dir, "index.log")
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, slot in self._slots.items():
+                f.write(f"{key} {slot}\n")
+        self._index_file.close()
+        os.replace(tmp_path, index_path)
+        self._index_file = open(index_path, "a", encoding="utf-8")
+        self._index_lines = len(self._slots)
+
+
+# Embedding-Modell und Vektorstore werden erst bei Bedarf bzw. im Hintergrund geladen
+
+def _create_embedding():
+    # Jedes Backend bekommt einen eigenen Cache, da sich die Vektoren leicht unterscheiden
+    base, variant = create_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL, os.path.join(ONNX_MODEL_DIR, EMBEDDING_MODEL))
+    return CachedEmbeddings(base, os.path.join(EMBEDDING_CACHE_DIR, variant))
+
+
+def _load_vectorstore():
+    # Hauptindex per Memory-Mapping, neue Einträge in einem Append-only-Segment
+    return SegmentedVectorStore(VECTORSTORE_PATH, embedding.get())
+
+
+embedding = Lazy("embeddings", _create_embedding)
+vectorstore = Lazy("vectorstore", _load_vectorstore)
 
 # Langzeitgedächtnis laden/speichern
-def load_memory() -> List[BaseMessage]:
-    if not os.path.exists(MEMORY_FILE):
-        return []
-    with open(MEMORY_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
+# Das Gedächtnis liegt als Append-only-Log (MEMORY_LOG) vor; die alte JSON-Datei wird beim
+# ersten Öffnen übernommen.
+
+def open_journal(path: str = MEMORY_LOG) -> MessageJournal:
+    return MessageJournal(path, legacy_path=MEMORY_FILE if path == MEMORY_LOG else None)
+
+
+def record_to_message(item: dict) -> BaseMessage:
+    msg_id = str(item["id"]) if "id" in item else None
+    if item["type"] == "human":
+        return HumanMessage(content=item["content"], id=msg_id)
+    elif item["type"] == "ai":
+        return AIMessage(content=item["content"], id=msg_id)
+    elif item["type"] == "summary":
+        content = item["content"]
+        if not content.startswith("[Summary of older conversations]"):
+            content = f"[Summary of older conversations]\n{content}"
+        return SystemMessage(content=content, id=msg_id)
+    return None
+
+
+def message_to_record(msg: BaseMessage) -> dict:
+    if isinstance(msg, HumanMessage):
+        return {"type": "human", "content": msg.content}
+    elif isinstance(msg, AIMessage):
+        return {"type": "ai", "content": msg.content}
+    elif isinstance(msg, SystemMessage):
+        return {"type": "summary", "content": msg.content}
+    return None
 
+
+def load_memory(journal: MessageJournal = None) -> List[BaseMessage]:
+    # Streamt das Log zeilenweise statt ein großes Dokument zu laden
+    journal = journal or open_journal()
     messages = []
-    for item in data:
-        if item["type"] == "human":
-            messages.append(HumanMessage(content=item["content"]))
-        elif item["type"] == "ai":
-            messages.append(AIMessage(content=item["content"]))
-        elif item["type"] == "summary":
-            messages.append(SystemMessage(content=f"[Summary of older conversations]\n{item['content']}"))
+    for item in journal.records():
+        msg = record_to_message(item)
+        if msg is not None:
+            messages.append(msg)
     return messages
 
 
-def save_memory(messages: List[BaseMessage]):
-    data = []
-    for msg in messages:
-        if isinstance(msg, HumanMessage):
-            data.append({"type": "human", "content": msg.content})
-        elif isinstance(msg, AIMessage):
-            data.append({"type": "ai", "content": msg.content})
-        elif isinstance(msg, SystemMessage):
-            data.append({"type": "summary", "content": msg.content})
-
-    with open(MEMORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def save_memory(messages: List[BaseMessage], journal: MessageJournal = None):
+    # Vollständiger Schnappschuss (z. B. nach summarize_and_trim); ersetzt das Log atomar
+    journal = journal or open_journal()
+    records = []
+    for i, msg in enumerate(messages):
+        record = message_to_record(msg)
+        if record is not None:
+            record["id"] = int(msg.id) if msg.id and msg.id.isdigit() else journal.next_id + i
+            records.append(record)
+    journal.compact(records)
 
 
 # Zusammenfassen für Langzeitgedächtnis
@@ -75,6 +272,8 @@ def summarize_and_trim(messages: List[BaseMessage]) -> List[BaseMessage]:
     if len(messages) <= SUMMARY_LIMIT:
         return messages
 
+    # Eine vorhandene Zusammenfassung am Anfang wird fortgeschrieben, nicht neu erzeugt
+    previous = messages[0].content if isinstance(messages[0], SystemMessage) else ""
     base_msgs = [m for m in messages if isinstance(m, (HumanMessage, AIMessage))]
     to_summarize = base_msgs[:-SUMMARY_LIMIT]
     keep = base_msgs[-SUMMARY_LIMIT:]
@@ -82,59 +281,92 @@ def summarize_and_trim(messages: List[BaseMessage]) -> List[BaseMessage]:
     if not to_summarize:
         return messages
 
-    summary_prompt = ChatPromptTemplate.from_messages([
-        ("system", "Summarize the following conversation. Stick to the essentials, but retain personal details."),
-        ("human", "{text}")
-    ])
-    summary_chain: Runnable = summary_prompt | llm
+    summary = fold_into_summary(previous, to_summarize, priority=MAINTENANCE)
+    summarized_messages = [SystemMessage(content=summary)] + keep
+    return summarized_messages
 
-    full_text = "\n".join([m.content for m in to_summarize])
-    summary = summary_chain.invoke({"text": full_text})
 
-    summarized_messages = [SystemMessage(content=summary.content)] + keep
-    return summarized_messages
+def fold_into_summary(summary: str, messages: List[BaseMessage], priority: int = CONSOLIDATION, stale=None) -> str:
+    # Inkrementell: nur die neu verdrängten Nachrichten werden eingearbeitet
+    text = "\n".join([m.content for m in messages if isinstance(m, (HumanMessage, AIMessage))])
+    if not text:
+        return summary
+    if not summary:
+        return summarize_messages(messages, priority=priority, stale=stale)
+
+    fold_prompt = ChatPromptTemplate.from_messages([
+        ("system", "Update the running summary of a conversation with the new messages. Stick to the essentials, but retain personal details. Reply with the updated summary only."),
+        ("human", "Running summary:\n{summary}\n\nNew messages:\n{text}")
+    ])
+    fold_chain: Runnable = fold_prompt | llm.get()
+    # Über den Dispatcher, damit Antworten an den Nutzer Vorrang haben
+    return dispatcher.invoke(fold_chain, {"summary": summary, "text": text}, priority=priority, stale=stale)
 
 
-def summarize_messages(messages: List[BaseMessage]) -> str:
+def summarize_messages(messages: List[BaseMessage], priority: int = CONSOLIDATION, stale=None) -> str:
     summary_prompt = ChatPromptTemplate.from_messages([
         ("system", "Summarize the following conversation. Stick to the essentials, but retain personal details."),
         ("human", "{text}")
     ])
-    summary_chain = summary_prompt | llm
+    summary_chain = summary_prompt | llm.get()
     text = "\n".join([m.content for m in messages if isinstance(m, (HumanMessage, AIMessage))])
-    result = summary_chain.invoke({"text": text})
+    result = dispatcher.invoke(summary_chain, {"text": text}, priority=priority, stale=stale)
     return result
 
 
 # Episodenspeicherung
+# Episoden liegen in SQLite; die alte episodic_memory.json wird beim ersten Öffnen übernommen.
+
+episodes = Lazy("episodes", lambda: EpisodeStore(EPISODE_DB, legacy_path=EPISODIC_FILE))
 
-def load_episodes() -> List[dict]:
-    if not os.path.exists(EPISODIC_FILE):
-        return []
-    with open(EPISODIC_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
 
+def load_episodes(limit: int = None, offset: int = 0, **filters) -> List[dict]:
+    return episodes.get().query(limit=limit, offset=offset, newest_first=False, **filters)
 
-def save_episode(title: str, summary: str, messages: List[BaseMessage]):
-    episodes = load_episodes()
-    episodes.append({
-        "title": title,
-        "summary": summary,
-    })
-    with open(EPISODIC_FILE, "w", encoding="utf-8") as f:
-        json.dump(episodes, f, indent=2, ensure_ascii=False)
-    
-    add_to_vectorstore(title, summary)
+
+def save_episode(title: str, summary: str, messages: List[BaseMessage], topic: str = None, mood: str = None):
+    save_episodes([{"title": title, "summary": summary, "messages": messages, "topic": topic, "mood": mood}])
+
+
+def save_episodes(batch: List[dict]):
+    # Mehrere Episoden auf einmal: eine SQLite-Transaktion und ein Vektorstore-Aufruf
+    # Einträge: {"title", "summary", "messages", "topic", "mood", optional "session"}
+    if not batch:
+        return
+    now = time.time()
+    episode_ids = episodes.get().add_many([{
+        **item,
+        "message_ids": [m.id for m in item.get("messages") or []],
+        "created_at": now,
+    } for item in batch])
+
+    add_many_to_vectorstore([
+        (item["title"], item["summary"], {
+            "topic": item.get("topic"),
+            "timestamp": now,
+            "first_seen": now,
+            "episode_id": episode_id,
+            "session": item.get("session"),
+        })
+        for item, episode_id in zip(batch, episode_ids)
+    ])
 
 # Vektorstore: Hinzufügen & Suchen
 
-def add_to_vectorstore(title: str, content: str):
-    doc = Document(page_content=content, metadata={"title": title})
-    vectorstore.add_documents([doc])
-    vectorstore.save_local(VECTORSTORE_PATH)
+def add_to_vectorstore(title: str, content: str, metadata: dict = None):
+    add_many_to_vectorstore([(title, content, metadata or {})])
+
 
+def add_many_to_vectorstore(items: List[tuple]):
+    docs = [Document(page_content=content, metadata={"title": title, **metadata}) for title, content, metadata in items]
+    store = vectorstore.get()
+    store.add_documents(docs)
+    store.maybe_checkpoint()
 
-def search_vectorstore(query: str, k: int = 3) -> List[str]:
-    results = retriever.invoke(query)
-    return [doc.page_content for doc in results[:k]]
 
+def search_vectorstore(query: str, k: int = 3, topic: str = None, since: float = None,
+                       until: float = None, session: str = None) -> List[str]:
+    # Hybride Suche (BM25 + FAISS) mit Vorfilter nach Thema/Zeitraum/Sitzung und Aktualitätsgewichtung
+    results = hybrid_search(vectorstore.get(), query, k=k, topic=topic, since=since, until=until,
+                            session=session)
+    return [doc.page_content for doc in results if doc is not None]
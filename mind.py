@@ -1,18 +1,43 @@
 # core/mind.py
 import datetime
 import random
+import re
 import os
-import sys
-from langchain_ollama import OllamaLLM
+import time
+from collections import deque
 from langchain.prompts import PromptTemplate
-from langchain_core.runnables import RunnableMap, RunnableLambda
+from langchain_core.runnables import Runnable
+from langchain_core.callbacks import BaseCallbackHandler
+from core.lazy import Lazy
+from core.tracing import metrics, record_llm
 
-llm = OllamaLLM(
-    model="nous-hermes2",
-    temperature=1.1,
-    top_p=0.95,
-    num_predict=100
-)
+# Modell bleibt zwischen den Turns geladen, damit Ollama den KV-Cache des
+# gemeinsamen Prompt-Anfangs wiederverwenden kann
+KEEP_ALIVE = "30m"
+NUM_CTX = 4096
+# Anderer Ollama-Server (z. B. der Fake-Server der Benchmarks); None = Standard
+OLLAMA_BASE_URL = os.environ.get("KABO_OLLAMA_URL")
+# So viele Turns behält PromptEvalStats für reuse_ratio()
+PROMPT_STATS_WINDOW = 200
+
+
+def _create_llm():
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(
+        model="nous-hermes2",
+        temperature=1.1,
+        top_p=0.95,
+        num_predict=100,
+        num_ctx=NUM_CTX,
+        keep_alive=KEEP_ALIVE,
+        base_url=OLLAMA_BASE_URL,
+        # Am Modell statt an der Kette: so werden auch Hintergrundaufrufe gemessen
+        callbacks=[prompt_stats]
+    )
+
+
+# Wird erst beim ersten Zugriff (llm.get()) oder per llm.start() im Hintergrund erzeugt
+llm = Lazy("llm", _create_llm)
 
 BASE_DIR = os.path.dirname(__file__)
 
@@ -37,7 +62,7 @@ moods = {
     "shy": "When she's shy, Kabo-chan's voice becomes hushed and hesitant. She might speak in incomplete sentences or start a word only to trail off. Her phrasing is overly polite, and she often apologizes without needing to. She avoids eye contact and speaks with a nervous lilt. There's a lot of silence between words - some of it uncomfortable, some of it endearing. She's careful not to say anything too strange or too personal, though she blushes easily if complimented or teased."
 }
 
-kabo_state = {
+DEFAULT_STATE = {
     "mood": "neutral",
     "time_of_day": "day",
     "season": "season",
@@ -45,140 +70,309 @@ kabo_state = {
     "topic": ""
 }
 
-def update_mood(user_input):
-    triggers = {
-        # Happy (very common)
-        "i like your style": "happy",
-        "you made my day": "happy",
-        "tell me something fun": "happy",
-        "you're really easy to talk to": "happy",
-        "that suits you": "happy",
-        "remember that time": "happy",
-
-        # Moody (moderately common)
-        "you okay": "moody",
-        "you seem off": "moody",
-        "you always act like that": "moody",
-        "you're so quiet": "moody",
-        "you're not listening": "moody",
-        "why are you like this": "moody",
-
-        # Sarcastic (frequent with familiar people)
-        "so you're that type of person": "sarcastic",
-        "you're always so serious": "sarcastic",
-        "lighten up": "sarcastic",
-        "oh really": "sarcastic",
-        "that's cute": "sarcastic",
-        "aren't you clever": "sarcastic",
-
-        # Melancholic (uncommon, deep)
-        "do you think about the past": "melancholic",
-        "i miss how things used to be": "melancholic",
-        "i had a weird dream": "melancholic",
-        "let's talk about something real": "melancholic",
-        "everything's quiet": "melancholic",
-        "it feels different lately": "melancholic",
-
-        # High-Spirited (common when energized)
-        "let's hang out": "high-spirited",
-        "you look like you're in a great mood": "highspirited",
-        "that was fun": "highspirited",
-        "wanna do something wild": "highspirited",
-        "haha you're crazy": "highspirited",
-        "that's hilarious": "highspirited",
-
-        # Unhinged (rare, emotional extremes)
-        "you ever just snap": "unhinged",
-        "let's go wild": "unhinged",
-        "nothing matters": "unhinged",
-        "burn it all down": "unhinged",
-        "why not just disappear": "unhinged",
-
-        # Rebellic (uncommon, response to pressure)
-        "you shouldn't dress like that": "rebellic",
-        "that's not how it's done": "rebellic",
-        "you can't do that": "rebellic",
-        "you have to follow the rules": "rebellic",
-        "you're being too weird": "rebellic",
-
-        # Shy (emerges in intimate/unfamiliar settings)
-        "that was really brave of you": "shy",
-        "tell me about yourself": "shy",
-        "i think you're interesting": "shy",
-        "you're so special": "shy",
-        "i like you": "shy",
-        "can i ask you something personal": "shy"
-    }
-    for key, mood in triggers.items():
-        if key in user_input.lower():
-            kabo_state["mood"] = mood
-            return
+
+def new_state() -> dict:
+    # Eigener Zustand pro Sitzung (Server); die Desktop-App nutzt kabo_state
+    return dict(DEFAULT_STATE)
+
+
+kabo_state = new_state()
+
+MOOD_TRIGGERS = {
+    # Happy (very common)
+    "i like your style": "happy",
+    "you made my day": "happy",
+    "tell me something fun": "happy",
+    "you're really easy to talk to": "happy",
+    "that suits you": "happy",
+    "remember that time": "happy",
+
+    # Moody (moderately common)
+    "you okay": "moody",
+    "you seem off": "moody",
+    "you always act like that": "moody",
+    "you're so quiet": "moody",
+    "you're not listening": "moody",
+    "why are you like this": "moody",
+
+    # Sarcastic (frequent with familiar people)
+    "so you're that type of person": "sarcastic",
+    "you're always so serious": "sarcastic",
+    "lighten up": "sarcastic",
+    "oh really": "sarcastic",
+    "that's cute": "sarcastic",
+    "aren't you clever": "sarcastic",
+
+    # Melancholic (uncommon, deep)
+    "do you think about the past": "melancholic",
+    "i miss how things used to be": "melancholic",
+    "i had a weird dream": "melancholic",
+    "let's talk about something real": "melancholic",
+    "everything's quiet": "melancholic",
+    "it feels different lately": "melancholic",
+
+    # High-Spirited (common when energized)
+    "let's hang out": "high-spirited",
+    "you look like you're in a great mood": "highspirited",
+    "that was fun": "highspirited",
+    "wanna do something wild": "highspirited",
+    "haha you're crazy": "highspirited",
+    "that's hilarious": "highspirited",
+
+    # Unhinged (rare, emotional extremes)
+    "you ever just snap": "unhinged",
+    "let's go wild": "unhinged",
+    "nothing matters": "unhinged",
+    "burn it all down": "unhinged",
+    "why not just disappear": "unhinged",
+
+    # Rebellic (uncommon, response to pressure)
+    "you shouldn't dress like that": "rebellic",
+    "that's not how it's done": "rebellic",
+    "you can't do that": "rebellic",
+    "you have to follow the rules": "rebellic",
+    "you're being too weird": "rebellic",
+
+    # Shy (emerges in intimate/unfamiliar settings)
+    "that was really brave of you": "shy",
+    "tell me about yourself": "shy",
+    "i think you're interesting": "shy",
+    "you're so special": "shy",
+    "i like you": "shy",
+    "can i ask you something personal": "shy"
+}
+
+TOPIC_TRIGGERS = {
+    "music": "music",
+    "dream": "dreams",
+    "job": "career",
+    "work": "career",
+}
+
+# Beispielsätze für die semantische Themenerkennung (wenn kein Stichwort passt)
+TOPIC_EXAMPLES = {
+    "music": ["what songs are you listening to", "i went to a concert", "do you play bass or drums", "this band is great"],
+    "dreams": ["i had a strange dream last night", "do you remember your dreams", "i keep having the same nightmare"],
+    "career": ["my boss is annoying", "i have a deadline tomorrow", "i got a new position at the office", "i'm looking for a new job"],
+}
+
+# Ab dieser Kosinus-Ähnlichkeit greift die semantische Erkennung
+MOOD_SIMILARITY = 0.6
+TOPIC_SIMILARITY = 0.45
+
+
+def _compile_triggers(triggers: dict) -> re.Pattern:
+    # Ein einziger regulärer Ausdruck für alle Auslöser, in Tabellenreihenfolge. Der Lookahead
+    # prüft jede Position, auch innerhalb anderer Treffer; an einer Position gewinnt der
+    # frühere Eintrag. So bleibt es wie bisher beim ersten Eintrag, der irgendwo vorkommt.
+    return re.compile("(?=(" + "|".join(re.escape(k) for k in triggers) + "))")
+
+
+_MOOD_PATTERN = _compile_triggers(MOOD_TRIGGERS)
+_MOOD_PRIORITY = {key: i for i, key in enumerate(MOOD_TRIGGERS)}
+_TOPIC_PATTERN = _compile_triggers(TOPIC_TRIGGERS)
+_TOPIC_PRIORITY = {key: i for i, key in enumerate(TOPIC_TRIGGERS)}
+
+
+def _build_state_classifier():
+    from core.classifier import CentroidClassifier
+    from core.memory import embedding
+    mood_examples = {}
+    for phrase, mood in MOOD_TRIGGERS.items():
+        mood_examples.setdefault(mood, []).append(phrase)
+    return CentroidClassifier({"mood": mood_examples, "topic": TOPIC_EXAMPLES}, embedding.get().embed_documents)
+
+
+state_classifier = Lazy("state-classifier", _build_state_classifier)
+# (Eingabe, Ergebnis) als ein Tupel, damit parallele Sitzungen es atomar ersetzen
+_last_semantic = (None, {})
+
+
+def classify_semantic(user_input: str) -> dict:
+    """Stimmung/Thema über Embedding-Schwerpunkte; leer, solange das Embedding-Modell lädt."""
+    from core.memory import embedding
+    if not embedding.is_ready():
+        return {}
+    if not state_classifier.is_ready():
+        if state_classifier.started_at is None and state_classifier.error is None:
+            state_classifier.start()
+        return {}
+    global _last_semantic
+    last_input, result = _last_semantic
+    if last_input != user_input:
+        # Das Embedding der Eingabe landet im Cache und wird von der Suche wiederverwendet
+        vector = embedding.get().embed_query(user_input)
+        result = state_classifier.get().classify(vector)
+        _last_semantic = (user_input, result)
+    return result
+
+
+def update_mood(user_input, state: dict = kabo_state):
+    text = user_input.lower()
+    matches = [m.group(1) for m in _MOOD_PATTERN.finditer(text)]
+    if matches:
+        # Bei mehreren Treffern gilt wie bisher die Reihenfolge in MOOD_TRIGGERS
+        state["mood"] = MOOD_TRIGGERS[min(matches, key=_MOOD_PRIORITY.get)]
+        return
+
+    mood, score = classify_semantic(user_input).get("mood", (None, 0.0))
+    if mood is not None and score >= MOOD_SIMILARITY:
+        state["mood"] = mood
+        return
 
     if random.random() < 0.1:
-        kabo_state["mood"] = random.choice(list(moods.keys()))
+        state["mood"] = random.choice(list(moods.keys()))
 
 
-def update_topic(user_input):
-    # Primitive themenerkennung – später Vektorstore/Embeddings
-    if "music" in user_input:
-        kabo_state["topic"] = "music"
-    elif "dream" in user_input:
-        kabo_state["topic"] = "dreams"
-    elif "job" in user_input or "work" in user_input:
-        kabo_state["topic"] = "career"
-    else:
-        kabo_state["topic"] = "general"
+def update_topic(user_input, state: dict = kabo_state):
+    matches = [m.group(1) for m in _TOPIC_PATTERN.finditer(user_input.lower())]
+    if matches:
+        state["topic"] = TOPIC_TRIGGERS[min(matches, key=_TOPIC_PRIORITY.get)]
+        return
 
+    topic, score = classify_semantic(user_input).get("topic", (None, 0.0))
+    state["topic"] = topic if topic is not None and score >= TOPIC_SIMILARITY else "general"
 
-def update_time_and_season():
+
+def update_time_and_season(state: dict = kabo_state):
     now = datetime.datetime.now()
     hour = now.hour
-    kabo_state["time_of_day"] = (
+    state["time_of_day"] = (
         "morning" if 5 <= hour < 12 else
         "afternoon" if 12 <= hour < 18 else
         "evening" if 18 <= hour < 22 else
         "night"
     )
-    kabo_state["is_weekend"] = now.weekday() >= 5
+    state["is_weekend"] = now.weekday() >= 5
 
     month = now.month
     if month in [12, 1, 2]:
-        kabo_state["season"] = "winter"
+        state["season"] = "winter"
     elif month in [3, 4, 5]:
-        kabo_state["season"] = "spring"
+        state["season"] = "spring"
     elif month in [6, 7, 8]:
-        kabo_state["season"] = "summer"
+        state["season"] = "summer"
     else:
-        kabo_state["season"] = "autumn"
+        state["season"] = "autumn"
 
 
-def build_chain(state: dict) -> RunnableLambda:
-    prompt = PromptTemplate(
-        input_variables=["input", "chat_history", "context", "mood", "topic", "time_of_day", "season", "is_weekend"],
-        template="""
-System: You are Kabocha Morikawa, known as "Kabo-chan" — a laid-back, creative young woman with a strong sense of aesthetics, music, and DIY culture. You speak softly, honestly, and with a dreamy vibe. You enjoy deep yet relaxed conversations, and you're not afraid to bring up your own ideas or curiosities.  
-You naturally steer the conversation when you feel it's becoming too quiet. You’re especially passionate when it comes to feelings, artistic visions, and music culture.
+class PromptEvalStats(BaseCallbackHandler):
+    """Misst pro LLM-Aufruf, wie viele Prompt-Tokens Ollama neu auswerten musste.
+
+    Ollama meldet in `prompt_eval_count` nur die Tokens, die nicht aus dem
+    Cache des gemeinsamen Prompt-Anfangs kamen. Aus `eval_count` und
+    `eval_duration` kommen außerdem Tokens/s, beim Streamen auch die Zeit bis
+    zum ersten Token. Alles wird pro `run_id` gemerkt, weil parallele Sitzungen
+    und Hintergrundaufrufe dieselbe Instanz nutzen.
+    """
+
+    def __init__(self, window: int = PROMPT_STATS_WINDOW):
+        self.turns = deque(maxlen=window)
+        self._prompt_tokens = {}
+        self._started = {}
+        self._first_token = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        from core.context import count_tokens
+        self._started[run_id] = time.perf_counter()
+        self._prompt_tokens[run_id] = count_tokens(prompts[0]) if prompts else None
 
-Mood: {mood}
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if run_id not in self._first_token and run_id in self._started:
+            self._first_token[run_id] = time.perf_counter() - self._started[run_id]
 
-Time: {time_of_day}, Season: {season}, Weekend: {is_weekend}
-Topic: {topic}
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._forget(run_id)
 
-Hobbies & interests (as reflections of her personality):
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        estimate = self._prompt_tokens.get(run_id)
+        first_token = self._first_token.get(run_id)
+        self._forget(run_id)
+        if not response.generations or not response.generations[0]:
+            return
+        info = response.generations[0][0].generation_info or {}
+        # Echte Token-Zahl und reine Generierungszeit von Ollama (Nanosekunden)
+        record_llm(info.get("eval_count") or 0, info.get("eval_duration", 0) / 1e9, first_token)
+        evaluated = info.get("prompt_eval_count")
+        if evaluated is None:
+            return
+        self.turns.append({
+            "prompt_tokens_estimate": estimate,
+            "prompt_eval_count": evaluated,
+            "prompt_eval_ms": info.get("prompt_eval_duration", 0) / 1e6,
+        })
+        metrics.observe("kabo_llm_prompt_eval_tokens", "llm", evaluated)
+
+    def reuse_ratio(self) -> float:
+        # Anteil der Prompt-Tokens, die aus dem Cache kamen (geschätzt, letzte `window` Turns)
+        turns = list(self.turns)
+        total = sum(t["prompt_tokens_estimate"] or 0 for t in turns)
+        evaluated = sum(t["prompt_eval_count"] for t in turns)
+        return max(0.0, 1 - evaluated / total) if total else 0.0
+
+    def _forget(self, run_id):
+        self._started.pop(run_id, None)
+        self._prompt_tokens.pop(run_id, None)
+        self._first_token.pop(run_id, None)
+
+
+prompt_stats = PromptEvalStats()
+
+PERSONA = """System: You are Kabocha Morikawa, known as "Kabo-chan" — a laid-back, creative young woman with a strong sense of aesthetics, music, and DIY culture. You speak softly, honestly, and with a dreamy vibe. You enjoy deep yet relaxed conversations, and you're not afraid to bring up your own ideas or curiosities.  
+You naturally steer the conversation when you feel it's becoming too quiet. You’re especially passionate when it comes to feelings, artistic visions, and music culture."""
+
+HOBBIES = """Hobbies & interests (as reflections of her personality):
 - drawn to complex and emotional music — she feels safe in chaotic beauty
 - likes Japanese pop culture because it's both cute and surreal, like her inner world
 - enjoys dystopian stories — they match her quiet fear that things will never quite make sense
 - likes instruments with deep textures like bass and drums — they're grounding
-- enjoys taking care of others through small rituals, like tea or handmade gifts
+- enjoys taking care of others through small rituals, like tea or handmade gifts"""
+
+RULES = "Never act or answer as the Person You. Keep the answer under 100 tokens."
 
-Never act or answer as the Person You. Keep the answer under 100 tokens.
+# Ursprüngliches Layout: Stimmung/Zeit/Thema stehen direkt hinter der Persona
+LEGACY_TEMPLATE = f"""
+{PERSONA}
 
+Mood: {{mood}}
+
+Time: {{time_of_day}}, Season: {{season}}, Weekend: {{is_weekend}}
+Topic: {{topic}}
+
+{HOBBIES}
+
+{RULES}
+
+{{context}}
 Conversation so far:
-{chat_history}
+{{chat_history}}
 
-User: {input}
+User: {{input}}
 Kabo-chan:"""
-    )
-    chain = prompt | llm
-    return RunnableLambda(lambda inputs: chain.invoke(inputs))
 
+# Cache-freundliches Layout: byte-stabiler Anfang (Persona, Hobbys, Regeln, Verlauf),
+# alles Veränderliche steht erst kurz vor der Nutzereingabe
+CACHED_TEMPLATE = f"""
+{PERSONA}
+
+{HOBBIES}
+
+{RULES}
+
+Conversation so far:
+{{chat_history}}
+
+{{context}}
+[Current state] Mood: {{mood}} | Time: {{time_of_day}}, Season: {{season}}, Weekend: {{is_weekend}} | Topic: {{topic}}
+
+User: {{input}}
+Kabo-chan:"""
+
+
+def build_chain(state: dict, prompt_caching: bool = True) -> Runnable:
+    prompt = PromptTemplate(
+        input_variables=["input", "chat_history", "context", "mood", "topic", "time_of_day", "season", "is_weekend"],
+        template=CACHED_TEMPLATE if prompt_caching else LEGACY_TEMPLATE
+    )
+    # Direkt die Sequenz zurückgeben, damit neben invoke() auch stream() Token liefert
+    return prompt | llm.get()
@@ -0,0 +1,135 @@
+# core/playback.py
+import threading
+import time
+from collections import deque
+import numpy as np
+import sounddevice as sd
+
+# Abtastrate der TTS (Chatterbox); andere Raten öffnen den Stream einmalig neu
+DEFAULT_SAMPLERATE = 24000
+# 20 ms pro Block: kurze Reaktionszeit beim Unterbrechen, ohne Aussetzer
+BLOCKSIZE = 480
+
+
+class AudioEngine:
+    """Langlebiger Ausgabestream, der Puffer nahtlos hintereinander abspielt.
+
+    Puffer werden in eine deque gelegt (append/popleft sind atomar), der
+    Audio-Callback liest sie ohne Sperren. `interrupt()` verwirft alles
+    Ausstehende beim nächsten Block; die letzte Antwort bleibt für `replay()` im Speicher.
+    """
+
+    def __init__(self, samplerate: int = DEFAULT_SAMPLERATE, blocksize: int = BLOCKSIZE):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.last_reply = None
+        self._queue = deque()
+        self._current = None
+        self._position = 0
+        # Jeder interrupt() erhöht die Generation; ältere Puffer werden nicht mehr gespielt
+        self._generation = 0
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+        self._stream = None
+
+    def enqueue(self, data: np.ndarray, samplerate: int):
+        data = np.asarray(data, dtype=np.float32)
+        if data.ndim > 1:
+            data = data.mean(axis=1)
+        with self._lock:
+            if self._stream is None or samplerate != self.samplerate:
+                self._open(samplerate)
+            self._idle.clear()
+            self._queue.append((self._generation, data))
+
+    def play(self, data: np.ndarray, samplerate: int, wait: bool = True):
+        self.enqueue(data, samplerate)
+        if wait:
+            self.wait_idle()
+
+    def wait_idle(self, cancel: threading.Event = None, timeout: float = None) -> bool:
+        # Wartet, bis alles Eingereihte gespielt (oder verworfen) wurde
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.is_busy():
+            if cancel is not None and cancel.is_set():
+                self.interrupt()
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self._idle.wait(0.05)
+        return True
+
+    def is_busy(self) -> bool:
+        return bool(self._queue) or self._current is not None
+
+    def interrupt(self):
+        # Barge-in: der Callback verwirft ältere Puffer beim nächsten Block
+        self._generation += 1
+        self._queue.clear()
+
+    def remember(self, data: np.ndarray, samplerate: int):
+        self.last_reply = (np.asarray(data, dtype=np.float32), samplerate)
+
+    def replay(self) -> bool:
+        if self.last_reply is None:
+            return False
+        self.interrupt()
+        self.enqueue(*self.last_reply)
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._stream is not None:
+                self._stream.stop()
+                self._stream.close()
+                self._stream = None
+
+    def _open(self, samplerate: int):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+        self.samplerate = samplerate
+        self._stream = sd.OutputStream(samplerate=samplerate, channels=1, dtype="float32",
+                                       blocksize=self.blocksize, latency="low", callback=self._callback)
+        self._stream.start()
+
+    def _callback(self, outdata, frames, time_info, status):
+        generation = self._generation
+        if self._current is not None and self._current[0] != generation:
+            self._current = None
+        filled = 0
+        while filled < frames:
+            if self._current is None:
+                try:
+                    self._current = self._queue.popleft()
+                except IndexError:
+                    break
+                self._position = 0
+                if self._current[0] != generation:
+                    self._current = None
+                    continue
+            chunk = self._current[1]
+            take = min(frames - filled, len(chunk) - self._position)
+            outdata[filled:filled + take, 0] = chunk[self._position:self._position + take]
+            filled += take
+            self._position += take
+            if self._position >= len(chunk):
+                self._current = None
+        if filled < frames:
+            outdata[filled:] = 0
+        if self._current is None and not self._queue:
+            self._idle.set()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> AudioEngine:
+    # Ein Ausgabestream pro Prozess; das Gerät wird beim ersten Abspielen geöffnet
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AudioEngine()
+        return _engine
@@ -0,0 +1,148 @@
+# core/reindex.py
+"""Baut den Vektorindex aus allen gespeicherten Episoden neu auf.
+
+Nötig nach einem Wechsel des Embedding-Backends oder -Modells. Die Episoden
+werden aus SQLite gestreamt, in großen Stapeln auf mehrere Prozesse verteilt
+eingebettet und stapelweise in einen Vektorstore neben dem alten geschrieben;
+Beinahe-Duplikate werden dabei wie im Betrieb zusammengeführt. Zum Schluss
+übernimmt der alte Store dessen Hauptindex atomar. Kabo sollte dabei nicht
+laufen, sonst gehen zwischenzeitlich gespeicherte Episoden im Index verloren.
+
+Aufruf aus dem übergeordneten Verzeichnis:
+    python -m core.reindex --backend onnx --workers 4 --batch-size 256
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from core.embedders import EMBEDDING_BACKEND, create_backend
+
+# Texte pro Aufgabe an einen Arbeitsprozess
+REINDEX_BATCH_SIZE = 256
+# Aufgaben pro Prozess gleichzeitig in der Warteschlange (begrenzt den Speicher beim Streamen)
+INFLIGHT_PER_WORKER = 2
+# Checkpoint-Abstand des neu aufgebauten Stores; seltener als im Betrieb, da nur angehängt wird
+REINDEX_CHECKPOINT_EVERY = 5000
+
+_embedder = None
+
+
+def _init_worker(backend: str, model_name: str, model_dir: str, batch_size: int, threads: int):
+    # Läuft einmal pro Prozess; das Backend wurde im Hauptprozess bereits validiert
+    global _embedder
+    if backend == "torch":
+        import torch
+        torch.set_num_threads(threads)
+    _embedder, _variant = create_backend(backend, model_name, model_dir, batch_size=batch_size,
+                                         threads=threads, validate_onnx=False)
+
+
+def _embed_chunk(texts):
+    return _embedder.embed_documents(texts)
+
+
+def _chunks(store, size: int):
+    chunk = []
+    for episode in store.iter_all():
+        chunk.append(episode)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _document(episode: dict):
+    from langchain_core.documents import Document
+    return Document(page_content=episode["summary"], metadata={
+        "title": episode["title"],
+        "topic": episode["topic"],
+        "timestamp": episode["created_at"],
+        "first_seen": episode["created_at"],
+        "episode_id": episode["id"],
+        "session": episode["session"],
+    })
+
+
+def reindex(backend: str = EMBEDDING_BACKEND, workers: int = None, batch_size: int = REINDEX_BATCH_SIZE) -> dict:
+    from core.memory import (EMBEDDING_MODEL, EPISODE_DB, EPISODIC_FILE, ONNX_MODEL_DIR, VECTORSTORE_PATH)
+    from core.episodes import EpisodeStore
+    from core.embedders import OnnxEmbeddings
+    from core.vectorindex import SegmentedVectorStore
+
+    workers = workers or max(1, (os.cpu_count() or 1) // 2)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    model_dir = os.path.join(ONNX_MODEL_DIR, EMBEDDING_MODEL)
+
+    # Export, Quantisierung und Validierung einmal hier statt in jedem Arbeitsprozess
+    reference, variant = create_backend(backend, EMBEDDING_MODEL, model_dir, batch_size=batch_size)
+    resolved = "onnx" if isinstance(reference, OnnxEmbeddings) else "torch"
+    if resolved != backend:
+        print(f"⚠️ Neuindizierung mit {resolved} statt {backend}.")
+
+    # Neben dem alten Store auf demselben Dateisystem, damit der Hauptindex verschoben werden kann
+    staging_path = VECTORSTORE_PATH + ".reindex"
+    shutil.rmtree(staging_path, ignore_errors=True)
+    staging = SegmentedVectorStore(staging_path, reference, checkpoint_every=REINDEX_CHECKPOINT_EVERY)
+
+    def commit(chunk, future):
+        # Episoden kommen nach id, also in zeitlicher Reihenfolge; jüngere ersetzen ältere Duplikate
+        staging.add_embeddings([_document(e) for e in chunk], future.result(), dedupe=True)
+        staging.maybe_checkpoint()
+
+    store = EpisodeStore(EPISODE_DB, legacy_path=EPISODIC_FILE)
+    count = 0
+    started = time.perf_counter()
+    # spawn statt fork: der Hauptprozess hat das Modell samt Thread-Pools schon geladen
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(resolved, EMBEDDING_MODEL, model_dir, batch_size, threads)) as pool:
+        pending = deque()
+        for chunk in _chunks(store, batch_size):
+            count += len(chunk)
+            pending.append((chunk, pool.submit(_embed_chunk, [e["summary"] for e in chunk])))
+            if len(pending) >= workers * INFLIGHT_PER_WORKER:
+                commit(*pending.popleft())
+        while pending:
+            commit(*pending.popleft())
+    embed_seconds = time.perf_counter() - started
+    store.close()
+
+    documents = len(staging)
+    SegmentedVectorStore(VECTORSTORE_PATH, reference).adopt(staging)
+    total_seconds = time.perf_counter() - started
+    return {
+        "backend": resolved,
+        "variant": variant,
+        "episodes": count,
+        "documents": documents,
+        "workers": workers,
+        "batch_size": batch_size,
+        "embed_seconds": round(embed_seconds, 2),
+        "total_seconds": round(total_seconds, 2),
+        "texts_per_second": round(count / embed_seconds, 1) if embed_seconds > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vektorindex aus allen Episoden neu aufbauen")
+    parser.add_argument("--backend", choices=("torch", "onnx"), default=EMBEDDING_BACKEND)
+    parser.add_argument("--workers", type=int, default=None, help="Arbeitsprozesse (Standard: halbe Kernzahl)")
+    parser.add_argument("--batch-size", type=int, default=REINDEX_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    result = reindex(args.backend, args.workers, args.batch_size)
+    print(f"✅ {result['episodes']} Episoden neu indiziert, {result['documents']} nach dem Zusammenführen "
+          f"({result['backend']}, {result['workers']} Prozesse): "
+          f"{result['texts_per_second']} Texte/s, gesamt {result['total_seconds']} s")
+    if result["backend"] != EMBEDDING_BACKEND:
+        print(f"ℹ️ Für den Betrieb KABO_EMBEDDING_BACKEND={result['backend']} setzen, "
+              "sonst passen Anfrage- und Index-Vektoren nicht zusammen.")
+
+
+if __name__ == "__main__":
+    main()
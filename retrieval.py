@@ -0,0 +1,126 @@
+# core/retrieval.py
+import math
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from langchain_core.documents import Document
+
+# Gewichtung dicht (FAISS) gegen lexikalisch (BM25) und Halbwertszeit für die Aktualität
+DENSE_WEIGHT = 0.5
+RECENCY_HALF_LIFE_DAYS = 30.0
+# Kandidaten pro Quelle = max(k * FETCH_FACTOR, MIN_FETCH)
+FETCH_FACTOR = 4
+MIN_FETCH = 20
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "do", "for", "from", "has", "have",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "so", "that", "the", "this", "to",
+    "was", "we", "what", "with", "you", "your", "about", "conversation",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class BM25Index:
+    """Invertierter Index mit BM25-Bewertung, der beim Hinzufügen/Löschen mitgeführt wird."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_length: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, doc_id: str, text: str):
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+        counts: Dict[str, int] = defaultdict(int)
+        for term in tokenize(text):
+            counts[term] += 1
+        for term, tf in counts.items():
+            self.postings[term][doc_id] = tf
+        self.doc_terms[doc_id] = dict(counts)
+        self.doc_length[doc_id] = sum(counts.values())
+        self.total_length += self.doc_length[doc_id]
+
+    def remove(self, doc_id: str):
+        counts = self.doc_terms.pop(doc_id, None)
+        if counts is None:
+            return
+        for term in counts:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_length -= self.doc_length.pop(doc_id, 0)
+
+    def search(self, query: str, k: int, allowed: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        n = len(self.doc_terms)
+        if not n:
+            return []
+        avg_length = self.total_length / n or 1.0
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            # Seltene Begriffe (Namen, Songtitel) bekommen ein hohes IDF-Gewicht
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                length = self.doc_length[doc_id]
+                norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+                scores[doc_id] += idf * norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def recency_weight(metadata: dict, now: float, half_life_days: float) -> float:
+    timestamp = metadata.get("timestamp")
+    if not timestamp or not half_life_days:
+        return 1.0
+    age_days = max(0.0, now - timestamp) / 86400
+    return 0.5 ** (age_days / half_life_days)
+
+
+def hybrid_search(store, query: str, k: int = 3, topic: str = None, since: float = None,
+                  until: float = None, session: str = None, half_life_days: float = RECENCY_HALF_LIFE_DAYS,
+                  dense_weight: float = DENSE_WEIGHT) -> List[Document]:
+    """Kombiniert FAISS- und BM25-Treffer und liefert genau k Dokumente (sofern vorhanden).
+
+    Filter nach Thema, Zeitraum und Sitzung werden vor der Suche angewendet, nicht danach.
+    """
+    allowed = store.filter_ids(topic=topic, since=since, until=until, session=session)
+    if allowed is not None and not allowed:
+        return []
+    fetch = max(k * FETCH_FACTOR, MIN_FETCH)
+
+    dense = store.search_ids(query, fetch, allowed)
+    lexical = store.lexical_search(query, fetch, allowed)
+
+    # Beide Skalen auf [0, 1] bringen; bei normierten Vektoren ist cos = 1 - L2² / 2
+    dense_scores = {doc_id: max(0.0, 1 - distance / 2) for doc_id, distance in dense}
+    top_lexical = lexical[0][1] if lexical else 0.0
+    lexical_scores = {doc_id: score / top_lexical for doc_id, score in lexical} if top_lexical else {}
+
+    candidates = set(dense_scores) | set(lexical_scores)
+    metadata_by_id = store.metadata_of(candidates)
+    now = time.time()
+    combined = []
+    for doc_id in candidates:
+        metadata = metadata_by_id[doc_id]
+        score = dense_weight * dense_scores.get(doc_id, 0.0) + (1 - dense_weight) * lexical_scores.get(doc_id, 0.0)
+        combined.append((score * recency_weight(metadata, now, half_life_days), doc_id))
+    combined.sort(reverse=True)
+    # Zwischen Suche und Abruf kann der Worker ein Duplikat zusammengeführt haben
+    docs = (store.get_document(doc_id) for _score, doc_id in combined)
+    return [doc for doc in docs if doc is not None][:k]
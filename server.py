@@ -0,0 +1,342 @@
+# core/server.py
+"""Headless-Server: viele Chat-Sitzungen in einem Prozess, HTTP + WebSocket.
+
+LLM, Embeddings, Vektorstore und TTS werden von allen Sitzungen geteilt;
+Stimmung/Thema, Verlauf und Episoden-Namensraum gehören der einzelnen Sitzung.
+
+Aufruf aus dem übergeordneten Verzeichnis:
+    python -m core.server --port 8765
+
+Endpunkte:
+    POST   /sessions                   -> {"session": id}
+    POST   /sessions/{id}/messages     {"text": ...} -> {"reply": ...}
+    GET    /sessions/{id}/history      ?limit=50
+    DELETE /sessions/{id}
+    GET    /sessions/{id}/ws           WebSocket: {"text": ...} / {"type": "cancel"} senden,
+                                       {"type": "token"|"done"|"error"} empfangen
+    GET    /health
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from aiohttp import web, WSMsgType
+from core import lazy
+from core.intelligents import KaboAI, VOICE_SAMPLE
+from core.consolidation import ConsolidationWorker
+from core.dispatch import dispatcher
+from core.memory import embedding, vectorstore, episodes, message_to_record
+from core.mind import llm, state_classifier
+from core.speak import warm_up_tts
+from core.tracing import metrics
+
+SERVER_HOST = os.environ.get("KABO_SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("KABO_SERVER_PORT", "8765"))
+# Gleichzeitige Turns; sollte zu OLLAMA_NUM_PARALLEL des Ollama-Servers passen
+MAX_CONCURRENT_TURNS = int(os.environ.get("KABO_MAX_CONCURRENT_TURNS", "2"))
+MAX_SESSIONS = 1000
+# Sitzungen ohne Aktivität werden nach dieser Zeit geschlossen (Verlauf bleibt auf der Platte)
+SESSION_IDLE_SECONDS = 30 * 60
+HISTORY_LIMIT = 50
+
+
+class Session:
+    def __init__(self, session_id: str, consolidator: ConsolidationWorker, tts_enabled: bool):
+        self.id = session_id
+        self.ai = KaboAI(stream_speech=True, session=session_id, consolidator=consolidator,
+                         tts_enabled=tts_enabled)
+        # Turns einer Sitzung laufen nacheinander, verschiedene Sitzungen parallel
+        self.lock = asyncio.Lock()
+        self.cancel = None
+        self.last_active = time.monotonic()
+        # Verbundene WebSockets; solche Sitzungen werden nicht wegen Inaktivität geschlossen
+        self.sockets = 0
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        if self.cancel is not None:
+            self.cancel.set()
+        # Ein laufender Turn schreibt noch ins Journal; dann schließt run_turn am Ende
+        if not self.lock.locked():
+            self.ai.close()
+
+
+class SessionManager:
+    """Verwaltet Sitzungen und begrenzt die Zahl gleichzeitiger LLM-Turns."""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_TURNS, tts_enabled: bool = False):
+        self.tts_enabled = tts_enabled
+        self.sessions = {}
+        self.consolidator = ConsolidationWorker()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="turn")
+        self.slots = asyncio.Semaphore(max_concurrent)
+        self.waiting = 0
+        # Geschlossene Sitzungen, deren letzter Turn noch läuft
+        self.closing = {}
+
+    def get(self, session_id: str, create: bool = False) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            if not create:
+                raise web.HTTPNotFound(text=f"Unbekannte Sitzung: {session_id}")
+            if session_id in self.closing:
+                # Sonst schrieben zwei Journale gleichzeitig in denselben Verlauf
+                raise web.HTTPConflict(text=f"Sitzung wird noch geschlossen: {session_id}")
+            if len(self.sessions) >= MAX_SESSIONS:
+                self.evict_idle(0)
+            if len(self.sessions) >= MAX_SESSIONS:
+                raise web.HTTPServiceUnavailable(text="Zu viele Sitzungen")
+            try:
+                session = Session(session_id, self.consolidator, self.tts_enabled)
+            except ValueError as e:
+                raise web.HTTPBadRequest(text=str(e))
+            self.sessions[session_id] = session
+        session.last_active = time.monotonic()
+        return session
+
+    def attach(self, session_id: str) -> Session:
+        session = self.get(session_id, create=True)
+        session.sockets += 1
+        return session
+
+    def detach(self, session: Session):
+        session.sockets -= 1
+        session.last_active = time.monotonic()
+
+    def close(self, session_id: str):
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+            if session.lock.locked():
+                self.closing[session_id] = session
+
+    def evict_idle(self, idle_seconds: float = SESSION_IDLE_SECONDS):
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if (now - session.last_active >= idle_seconds and not session.lock.locked()
+                    and session.sockets == 0):
+                self.close(session_id)
+
+    async def run_turn(self, session: Session, text: str, on_token=None, player=None) -> str:
+        async with session.lock:
+            if session.closed:
+                raise web.HTTPGone(text=f"Sitzung geschlossen: {session.id}")
+            session.cancel = threading.Event()
+            session.ai.player = player
+            # Ohne Player (REST) keine Synthese: nie auf die Soundkarte des Servers zurückfallen
+            session.ai.tts_enabled = self.tts_enabled and player is not None
+            queued = time.perf_counter()
+            self.waiting += 1
+            try:
+                await self.slots.acquire()
+            finally:
+                self.waiting -= 1
+            try:
+                metrics.observe("kabo_turn_queue_seconds", "server", time.perf_counter() - queued)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self.executor, session.ai.get_response, text, on_token, session.cancel)
+            finally:
+                self.slots.release()
+                session.cancel = None
+                session.last_active = time.monotonic()
+                if session.closed:
+                    session.ai.close()
+                    self.closing.pop(session.id, None)
+
+    def shutdown(self):
+        for session_id in list(self.sessions):
+            self.close(session_id)
+        self.consolidator.stop()
+        self.executor.shutdown(wait=False)
+        if embedding.is_ready():
+            embedding.get().flush()
+        if episodes.is_ready():
+            episodes.get().close()
+
+
+def _manager(request) -> SessionManager:
+    return request.app["sessions"]
+
+
+async def create_session(request):
+    session_id = uuid.uuid4().hex
+    _manager(request).get(session_id, create=True)
+    return web.json_response({"session": session_id})
+
+
+async def post_message(request):
+    body = await request.json()
+    text = (body.get("text") or "").strip()
+    if not text:
+        raise web.HTTPBadRequest(text="'text' fehlt")
+    session = _manager(request).get(request.match_info["session"], create=True)
+    reply = await _manager(request).run_turn(session, text)
+    return web.json_response({"session": session.id, "reply": reply})
+
+
+async def get_history(request):
+    session = _manager(request).get(request.match_info["session"], create=True)
+    try:
+        limit = int(request.query.get("limit", HISTORY_LIMIT))
+    except ValueError:
+        raise web.HTTPBadRequest(text="'limit' muss eine ganze Zahl sein")
+    messages = session.ai.memory.get_messages()[-limit:] if limit > 0 else []
+    return web.json_response({"session": session.id, "messages": [
+        {"id": m.id, **message_to_record(m)} for m in messages if message_to_record(m) is not None
+    ]})
+
+
+async def delete_session(request):
+    _manager(request).close(request.match_info["session"])
+    return web.json_response({"closed": request.match_info["session"]})
+
+
+async def websocket(request):
+    manager = _manager(request)
+    session_id = request.match_info["session"]
+    session = manager.attach(session_id)
+    ws = web.WebSocketResponse(heartbeat=30)
+    try:
+        await ws.prepare(request)
+    except BaseException:
+        manager.detach(session)
+        raise
+    loop = asyncio.get_running_loop()
+    outbox = asyncio.Queue()
+
+    async def sender():
+        while True:
+            item = await outbox.get()
+            if item is None:
+                return
+            if isinstance(item, bytes):
+                await ws.send_bytes(item)
+            else:
+                await ws.send_json(item)
+
+    def on_token(chunk):
+        loop.call_soon_threadsafe(outbox.put_nowait, {"type": "token", "text": chunk})
+
+    def player(data, samplerate):
+        # Audio geht als int16-PCM an den Client statt an einen Lautsprecher
+        pcm = (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        loop.call_soon_threadsafe(outbox.put_nowait, {"type": "audio", "samplerate": samplerate,
+                                                      "bytes": len(pcm)})
+        loop.call_soon_threadsafe(outbox.put_nowait, pcm)
+
+    async def turn(text):
+        try:
+            reply = await manager.run_turn(session, text, on_token,
+                                           player if manager.tts_enabled else None)
+            outbox.put_nowait({"type": "done", "reply": reply})
+        except Exception as e:
+            outbox.put_nowait({"type": "error", "message": str(e)})
+
+    sending = asyncio.create_task(sender())
+    running = None
+    try:
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                data = msg.json()
+            except ValueError:
+                data = {"text": msg.data}
+            if data.get("type") == "cancel":
+                if session.cancel is not None:
+                    session.cancel.set()
+                continue
+            text = (data.get("text") or "").strip()
+            if not text:
+                continue
+            if session.closed:
+                # Per DELETE geschlossen: neu auflösen statt ins geschlossene Journal zu schreiben
+                if running is not None:
+                    await running
+                fresh = manager.attach(session_id)
+                manager.detach(session)
+                session = fresh
+            if running is not None and not running.done() and session.cancel is not None:
+                # Neue Nachricht während einer Antwort: die alte abbrechen
+                session.cancel.set()
+            running = asyncio.create_task(turn(text))
+    finally:
+        if running is not None and not running.done():
+            if session.cancel is not None:
+                session.cancel.set()
+            await running
+        manager.detach(session)
+        outbox.put_nowait(None)
+        await sending
+    return ws
+
+
+async def health(request):
+    manager = _manager(request)
+    return web.json_response({
+        "sessions": len(manager.sessions),
+        "waiting_turns": manager.waiting,
+        "pending": lazy.pending(),
+        "llm": dispatcher.stats(),
+    })
+
+
+async def _evict_loop(app):
+    while True:
+        await asyncio.sleep(60)
+        app["sessions"].evict_idle()
+
+
+async def _on_startup(app):
+    app["evictor"] = asyncio.create_task(_evict_loop(app))
+
+
+async def _on_cleanup(app):
+    app["evictor"].cancel()
+    app["sessions"].shutdown()
+
+
+def create_app(max_concurrent: int = MAX_CONCURRENT_TURNS, tts_enabled: bool = False) -> web.Application:
+    app = web.Application()
+    app["sessions"] = SessionManager(max_concurrent, tts_enabled)
+    app.router.add_post("/sessions", create_session)
+    app.router.add_post("/sessions/{session}/messages", post_message)
+    app.router.add_get("/sessions/{session}/history", get_history)
+    app.router.add_delete("/sessions/{session}", delete_session)
+    app.router.add_get("/sessions/{session}/ws", websocket)
+    app.router.add_get("/health", health)
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kabo-Server für mehrere Sitzungen")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT_TURNS,
+                        help="Gleichzeitige LLM-Turns (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--tts", action="store_true", help="Antworten zusätzlich als Audio über den WebSocket senden")
+    args = parser.parse_args(argv)
+
+    # Geteilte Modelle im Hintergrund laden
+    llm.start()
+    embedding.start()
+    vectorstore.start()
+    episodes.start()
+    state_classifier.start()
+    if args.tts:
+        warm_up_tts(audio_prompt_path=VOICE_SAMPLE)
+
+    print(f"Kabo-Server läuft auf http://{args.host}:{args.port}")
+    web.run_app(create_app(args.max_concurrent, args.tts), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,275 @@
 # core/speak.py
-from chatterbox.tts import ChatterboxTTS
 import soundfile as sf
 import os
-import sounddevice as sd
+import re
+import queue
+import hashlib
+import threading
+import numpy as np
 import soundfile as sf
+from core.lazy import Lazy
+from core.playback import get_engine
+from core.audiocache import AudioCache, audio_key
+from core.tracing import span, current_trace_id, record_tts
+
+# Gecachte Sprecher-Konditionierungen (Schlüssel: SHA-256 der Referenz-wav)
+VOICE_CACHE_DIR = os.path.join(os.path.dirname(__file__), "voice_cache")
+OUTPUT_PATH = os.path.join(os.path.dirname(__file__), "output.wav")
+# Bereits gesprochene Sätze (Begrüßungen, "I guess...", "Maybe.") kommen aus diesem Cache
+AUDIO_CACHE_DIR = os.path.join(os.path.dirname(__file__), "audio_cache")
+TTS_MODEL_NAME = "chatterbox"
+
+# "auto" = CUDA, falls vorhanden, sonst der optimierte CPU-Pfad
+TTS_DEVICE = os.environ.get("KABO_TTS_DEVICE", "auto")
+# CPU-Pfad: dynamische int8-Quantisierung der Linear-Schichten im T3-Sprachmodell
+TTS_QUANTIZE = os.environ.get("KABO_TTS_QUANTIZE", "1") == "1"
+# Threads für Operatoren (intra) bzw. parallele Operatoren (inter); 0 = PyTorch-Standard
+TTS_THREADS = int(os.environ.get("KABO_TTS_THREADS", "0"))
+TTS_INTEROP_THREADS = int(os.environ.get("KABO_TTS_INTEROP_THREADS", "1"))
+# torch.compile für den Transformer; lohnt erst bei langen Sitzungen (Kompilieren dauert)
+TTS_COMPILE = os.environ.get("KABO_TTS_COMPILE", "0") == "1"
+
+# Satzende: Satzzeichen (evtl. mit schließenden Anführungszeichen/Klammern) gefolgt von Leerraum
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'”)\]]*\s+|\n+")
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def resolve_device(device: str = None) -> str:
+    device = device or TTS_DEVICE
+    if device != "auto":
+        return device
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def configure_cpu_threads(threads: int = TTS_THREADS, interop_threads: int = TTS_INTEROP_THREADS):
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            # Geht nur, bevor PyTorch zum ersten Mal parallel gerechnet hat
+            torch.set_interop_threads(interop_threads)
+        except RuntimeError:
+            pass
+
 
 class KaboTTS:
-    def __init__(self, device: str = "cuda", audio_prompt_path: str = None):
+    def __init__(self, device: str = None, audio_prompt_path: str = None, quantize: bool = TTS_QUANTIZE,
+                 threads: int = TTS_THREADS, interop_threads: int = TTS_INTEROP_THREADS,
+                 compile_model: bool = TTS_COMPILE, audio_cache_dir: str = AUDIO_CACHE_DIR):
+        # Erst hier importieren: torch/chatterbox zu laden dauert mehrere Sekunden
+        import torch
+        from chatterbox.tts import ChatterboxTTS
+        device = resolve_device(device)
+        if device == "cpu":
+            configure_cpu_threads(threads, interop_threads)
         self.model = ChatterboxTTS.from_pretrained(device=device)
+        self.device = device
         self.audio_prompt_path = audio_prompt_path
+        self.voice_hash = None
+        self._lock = threading.Lock()
+        self.variant = TTS_MODEL_NAME
+        if audio_prompt_path:
+            self._load_voice(str(audio_prompt_path))
+        if device == "cpu" and quantize:
+            # Gewichte als int8, Aktivierungen werden pro Aufruf quantisiert; T3 dominiert die Rechenzeit
+            self.model.t3 = torch.ao.quantization.quantize_dynamic(self.model.t3, {torch.nn.Linear}, dtype=torch.qint8)
+            self.variant += "-int8"
+        if compile_model:
+            self.model.t3.tfmr = torch.compile(self.model.t3.tfmr, dynamic=True)
+        # Quantisierte Modelle klingen minimal anders und bekommen eigene Cache-Einträge
+        self.audio_cache = AudioCache(audio_cache_dir) if audio_cache_dir else None
+
+    def _load_voice(self, audio_prompt_path: str):
+        # Referenz-wav nur einmal verarbeiten, danach die Konditionierung von der Platte laden
+        self.voice_hash = file_hash(audio_prompt_path)
+        cache_path = os.path.join(VOICE_CACHE_DIR, f"{self.voice_hash}.pt")
+        if os.path.exists(cache_path):
+            from chatterbox.tts import Conditionals
+            self.model.conds = Conditionals.load(cache_path, map_location=self.device).to(self.device)
+            return
+
+        self.model.prepare_conditionals(audio_prompt_path)
+        os.makedirs(VOICE_CACHE_DIR, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        self.model.conds.save(tmp_path)
+        os.replace(tmp_path, cache_path)
+
+    @property
+    def sr(self) -> int:
+        return self.model.sr
+
+    def synthesize(self, text: str) -> np.ndarray:
+        # Gilt für ganze Antworten wie für einzelne Sätze aus der SpeechPipeline
+        import torch
+        key = audio_key(text, self.voice_hash or "default", self.variant, self.sr)
+        if self.audio_cache is not None:
+            cached = self.audio_cache.get(key)
+            if cached is not None:
+                return cached[0]
+        # inference_mode: kein Autograd-Buchhalten, Zwischenpuffer gehen direkt an den Allokator zurück
+        with self._lock, torch.inference_mode():
+            # Konditionierung liegt bereits in self.model.conds
+            wav = self.model.generate(text)
+        wav = wav[0].detach().cpu().numpy()
+        if self.audio_cache is not None:
+            self.audio_cache.put(key, wav, self.sr)
+        return wav
 
     def speak(self, text: str, output_path: str = None):
         if output_path is None:
-            output_path = os.path.join(os.path.dirname(__file__), "output.wav")
-        if self.audio_prompt_path:
-            wav = self.model.generate(text, audio_prompt_path=self.audio_prompt_path)
-        else:
-            wav = self.model.generate(text)
-        sf.write(output_path, wav[0], self.model.sr)
+            output_path = OUTPUT_PATH
+        sf.write(output_path, self.synthesize(text), self.sr)
         print(f"Audio gespeichert unter: {output_path}")
 
+
+# Langlebige TTS-Instanz: wird einmal geladen und danach für jede Antwort wiederverwendet
+tts = Lazy("tts", KaboTTS)
+
+
+def get_tts(device: str = None, audio_prompt_path: str = None) -> KaboTTS:
+    # Die Argumente wirken nur beim ersten Aufruf, der das Modell lädt
+    return tts.get(device=device, audio_prompt_path=audio_prompt_path)
+
+
+def warm_up_tts(device: str = None, audio_prompt_path: str = None) -> threading.Thread:
+    return tts.start(device=device, audio_prompt_path=audio_prompt_path)
+
+
+def split_sentences(tokens, min_chars: int = 12):
+    """Fasst gestreamte LLM-Token zu Sätzen zusammen, sobald ein Satz vollständig ist."""
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        while True:
+            match = _SENTENCE_END.search(buffer)
+            # Sehr kurze Fragmente ("Oh." / "Hm...") mit dem nächsten Satz zusammen sprechen
+            while match and len(buffer[:match.end()].strip()) < min_chars:
+                match = _SENTENCE_END.search(buffer, match.end())
+            if not match:
+                break
+            sentence = buffer[:match.end()].strip()
+            buffer = buffer[match.end():]
+            if sentence:
+                yield sentence
+    if buffer.strip():
+        yield buffer.strip()
+
+
+class SpeechPipeline:
+    """Synthetisiert Sätze in einem Worker und spielt sie direkt aus dem Speicher ab.
+
+    Synthese und Wiedergabe laufen in eigenen Threads, sodass der nächste Satz
+    bereits erzeugt wird, während der vorherige noch zu hören ist. Ohne eigenen
+    player gehen die Sätze lückenlos an die AudioEngine.
+    """
+
+    def __init__(self, tts_factory, player=None):
+        self._tts_factory = tts_factory
+        self._engine = None if player else get_engine()
+        self._player = player or self._engine.enqueue
+        # Spans der Worker-Threads gehören zum Turn, in dem die Pipeline erzeugt wurde
+        self.trace_id = current_trace_id()
+        self._sentences = queue.Queue()
+        self._audio = queue.Queue()
+        self.samplerate = None
+        self.chunks = []
+        self._cancelled = threading.Event()
+        self._synth_thread = threading.Thread(target=self._synthesize_loop, name="tts-synth", daemon=True)
+        self._play_thread = threading.Thread(target=self._play_loop, name="tts-play", daemon=True)
+        self._synth_thread.start()
+        self._play_thread.start()
+
+    def feed(self, sentence: str):
+        self._sentences.put(sentence)
+
+    def close(self, cancel: threading.Event = None):
+        # Wartet, bis alle Sätze synthetisiert und abgespielt sind (oder cancel gesetzt wird)
+        self._sentences.put(None)
+        while self._play_thread.is_alive():
+            if cancel is not None and cancel.is_set():
+                self.cancel()
+                return
+            self._play_thread.join(0.1)
+        if self._engine is None:
+            return
+        # Die Engine spielt noch, was eingereiht ist; danach steht die Antwort für replay() bereit
+        if self.chunks:
+            self._engine.remember(np.concatenate(self.chunks), self.samplerate)
+        self._engine.wait_idle(cancel)
+
+    def cancel(self):
+        # Noch nicht gesprochene Sätze verwerfen und die laufende Wiedergabe abbrechen
+        self._cancelled.set()
+        if self._engine is not None:
+            self._engine.interrupt()
+
+    def save(self, output_path: str = None):
+        if not self.chunks:
+            return
+        sf.write(output_path or OUTPUT_PATH, np.concatenate(self.chunks), self.samplerate)
+
+    def _synthesize_loop(self):
+        try:
+            with span("tts_load", trace_id=self.trace_id):
+                tts = self._tts_factory()
+            self.samplerate = tts.sr
+        except Exception as e:
+            print(f"TTS-Fehler: {e}")
+            tts = None
+        while True:
+            sentence = self._sentences.get()
+            if sentence is None:
+                self._audio.put(None)
+                return
+            if tts is None or self._cancelled.is_set():
+                continue
+            try:
+                with span("tts_synthesize", trace_id=self.trace_id, chars=len(sentence)) as s:
+                    wav = tts.synthesize(sentence)
+                    audio_seconds = len(wav) / tts.sr
+                    s.set(audio_seconds=round(audio_seconds, 3), rtf=round(s.elapsed() / audio_seconds, 3) if audio_seconds else None)
+                record_tts(s.duration, audio_seconds)
+                self._audio.put(wav)
+            except Exception as e:
+                print(f"TTS-Fehler: {e}")
+
+    def _play_loop(self):
+        while True:
+            wav = self._audio.get()
+            if wav is None:
+                return
+            if self._cancelled.is_set():
+                continue
+            self.chunks.append(wav)
+            try:
+                with span("playback", trace_id=self.trace_id, audio_seconds=round(len(wav) / self.samplerate, 3)):
+                    self._player(wav, self.samplerate)
+            except Exception as e:
+                print(f"Wiedergabe-Fehler: {e}")
+
+
+def play_buffer(data: np.ndarray, samplerate: int):
+    # Über den dauerhaft offenen Ausgabestream statt sd.play (kein Öffnen des Geräts pro Aufruf)
+    get_engine().play(data, samplerate)
+
+
 def play_audio(file_path: str):
-    data, samplerate = sf.read(file_path)
-    sd.play(data, samplerate)
-    sd.wait()
+    data, samplerate = sf.read(file_path, dtype="float32")
+    play_buffer(data, samplerate)
+
+
+def replay_last() -> bool:
+    """Spielt die letzte Antwort erneut aus dem Speicher ab."""
+    return get_engine().replay()
 
 # Beispielverwendung
 if __name__ == "__main__":
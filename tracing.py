@@ -0,0 +1,253 @@
+# core/tracing.py
+import collections
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACE_DIR = os.path.join(os.environ.get("KABO_DATA_DIR", os.path.dirname(__file__)), "traces")
+TRACE_FILE = os.path.join(TRACE_DIR, "trace.jsonl")
+TRACE_MAX_BYTES = 5 * 1024 * 1024
+TRACE_BACKUPS = 5
+# Anzahl der letzten Messwerte pro Stufe für p50/p95
+WINDOW = 2048
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.environ.get("KABO_METRICS_PORT", "9464"))
+# Spans, während denen der Sampling-Profiler läuft, z. B. KABO_PROFILE="llm,tts_synthesize"
+PROFILE_SPANS = {name for name in os.environ.get("KABO_PROFILE", "").split(",") if name}
+PROFILE_INTERVAL = 0.005
+
+_local = threading.local()
+_logger = None
+_logger_lock = threading.Lock()
+
+
+class Metrics:
+    """Sammelt Dauern und weitere Messwerte pro Name und berechnet Quantile."""
+
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self._count = collections.Counter()
+        self._sum = collections.Counter()
+
+    def observe(self, family: str, label: str, value: float):
+        with self._lock:
+            key = (family, label)
+            self._samples[key].append(value)
+            self._count[key] += 1
+            self._sum[key] += value
+
+    def quantiles(self, family: str, label: str, qs=(0.5, 0.95)) -> dict:
+        with self._lock:
+            values = sorted(self._samples.get((family, label), ()))
+        if not values:
+            return {}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in qs}
+
+    def summary(self) -> dict:
+        with self._lock:
+            keys = list(self._samples)
+        result = {}
+        for family, label in keys:
+            q = self.quantiles(family, label)
+            result.setdefault(family, {})[label] = {
+                "count": self._count[(family, label)],
+                "p50": q.get(0.5),
+                "p95": q.get(0.95),
+            }
+        return result
+
+    def prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            keys = sorted(self._samples)
+        families = sorted({family for family, _label in keys})
+        for family in families:
+            lines.append(f"# TYPE {family} summary")
+            for fam, label in keys:
+                if fam != family:
+                    continue
+                for q, value in self.quantiles(fam, label, (0.5, 0.95, 0.99)).items():
+                    lines.append(f'{family}{{stage="{label}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'{family}_sum{{stage="{label}"}} {self._sum[(fam, label)]:.6f}')
+                lines.append(f'{family}_count{{stage="{label}"}} {self._count[(fam, label)]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent: "Span" = None, attrs: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.attrs = dict(attrs or {})
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+
+@contextmanager
+def span(name: str, trace_id: str = None, **attrs):
+    """Misst eine Stufe; verschachtelte Spans im selben Thread werden zu Kindern.
+
+    Über `trace_id` können Spans aus Worker-Threads dem Turn zugeordnet werden.
+    """
+    stack = _stack()
+    parent = stack[-1] if stack else None
+    current = Span(name, trace_id or (parent.trace_id if parent else uuid.uuid4().hex), parent, attrs)
+    stack.append(current)
+    profiler = SamplingProfiler(threading.get_ident(), name) if name in PROFILE_SPANS else None
+    if profiler:
+        profiler.start()
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=repr(e))
+        raise
+    finally:
+        current.duration = current.elapsed()
+        stack.pop()
+        if profiler:
+            profiler.stop()
+        metrics.observe("kabo_stage_duration_seconds", name, current.duration)
+        _write(current)
+
+
+def current_span() -> Span:
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def current_trace_id() -> str:
+    current = current_span()
+    return current.trace_id if current else None
+
+
+def record_llm(tokens: int, seconds: float, first_token_seconds: float = None):
+    if seconds > 0 and tokens:
+        metrics.observe("kabo_llm_tokens_per_second", "llm", tokens / seconds)
+    if first_token_seconds is not None:
+        metrics.observe("kabo_llm_first_token_seconds", "llm", first_token_seconds)
+
+
+def record_tts(synth_seconds: float, audio_seconds: float):
+    # Real-Time-Factor: Synthesedauer / Audiodauer (< 1 heißt schneller als Echtzeit)
+    if audio_seconds > 0:
+        metrics.observe("kabo_tts_real_time_factor", "tts", synth_seconds / audio_seconds)
+
+
+class SamplingProfiler:
+    """Tastet den Stack eines Threads periodisch ab und schreibt "collapsed stacks".
+
+    Die Ausgabe (traces/profile-<span>.folded) lässt sich direkt mit flamegraph.pl
+    oder speedscope ansehen.
+    """
+
+    def __init__(self, thread_id: int, label: str, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.label = label
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{label}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        with open(os.path.join(TRACE_DIR, f"profile-{self.label}.folded"), "a", encoding="utf-8") as f:
+            for stack, count in self.stacks.items():
+                f.write(f"{stack} {count}\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            body = metrics.prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif self.path.startswith("/stats"):
+            body = json.dumps(metrics.summary(), indent=2).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+def serve_metrics(host: str = METRICS_HOST, port: int = METRICS_PORT) -> ThreadingHTTPServer:
+    """Startet /metrics (Prometheus-Text) und /stats (JSON mit p50/p95) in einem Hintergrund-Thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def _stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _write(current: Span):
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                os.makedirs(TRACE_DIR, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger("kabo.trace")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                logger.addHandler(handler)
+                _logger = logger
+    _logger.info(json.dumps({
+        "trace": current.trace_id,
+        "span": current.span_id,
+        "parent": current.parent.span_id if current.parent else None,
+        "name": current.name,
+        "start": current.start,
+        "duration_ms": round(current.duration * 1000, 3),
+        "thread": threading.current_thread().name,
+        **current.attrs,
+    }, ensure_ascii=False, default=str))
@@ -0,0 +1,593 @@
+# core/vectorindex.py
+import base64
+import json
+import math
+import os
+import pickle
+import shutil
+import threading
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from core.retrieval import BM25Index
+
+# Nach so vielen neuen Einträgen im Segment wird in den Hauptindex übernommen
+CHECKPOINT_EVERY = 200
+
+# Indextyp des Hauptindex: "flat", "hnsw" oder "ivf". Unterhalb von ANN_THRESHOLD
+# Einträgen bleibt es bei der exakten Suche; beim Überschreiten wird neu aufgebaut.
+INDEX_TYPE = "hnsw"
+ANN_THRESHOLD = 5000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+IVF_NLIST_FACTOR = 4
+IVF_NPROBE = 8
+# Ab diesem Anteil gelöschter Einträge im Hauptindex baut ein Checkpoint neu auf, statt anzuhängen
+TOMBSTONE_REBUILD_RATIO = 0.2
+
+# Ab dieser Kosinus-Ähnlichkeit ersetzt eine neue Episode die vorhandene
+DUPLICATE_SIMILARITY = 0.92
+
+
+class SegmentedVectorStore:
+    """FAISS-Vektorstore mit inkrementeller Persistenz.
+
+    Der Hauptindex (letzter Checkpoint) wird per Memory-Mapping geladen. Neue Dokumente
+    landen zusätzlich in einem kleinen In-Memory-Index und werden samt Vektor an ein
+    Append-only-Segment (segment.log) gehängt; Löschungen werden dort als Tombstones
+    vermerkt. Erst ein Checkpoint schreibt einen neuen Hauptindex und leert das Segment.
+    Dabei werden die neuen Vektoren angehängt; neu aufgebaut wird nur beim Wechsel des
+    Indextyps oder wenn zu viele gelöschte Einträge im Hauptindex liegen.
+    """
+
+    def __init__(self, path: str, embedding: Embeddings, checkpoint_every: int = CHECKPOINT_EVERY,
+                 index_type: str = INDEX_TYPE, ann_threshold: int = ANN_THRESHOLD,
+                 duplicate_similarity: float = DUPLICATE_SIMILARITY):
+        self.path = path
+        self.embedding = embedding
+        self.checkpoint_every = checkpoint_every
+        self.index_type = index_type
+        self.ann_threshold = ann_threshold
+        self.duplicate_similarity = duplicate_similarity
+        self._lock = threading.RLock()
+        self._deleted = set()
+        self._seq = 0
+        self._applied_seq = 0
+        # Gelöschte Einträge, die noch im Hauptindex stehen (ohne Docstore-Eintrag)
+        self._main_dead = 0
+        self._main_dir = None
+        self.main = None
+        self.delta = None
+        # Nebenindizes über alle lebenden Dokumente: BM25 und Metadaten für Vorfilter
+        self.lexical = BM25Index()
+        self.metadata = {}
+        self._by_topic = defaultdict(set)
+        self._by_session = defaultdict(set)
+        self._main_positions = {}
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # Lesen
+
+    def __len__(self):
+        with self._lock:
+            return self.main.index.ntotal + self.delta.index.ntotal - len(self._deleted) - self._main_dead
+
+    def similarity_search_with_score(self, query: str, k: int = 4, fetch_k: int = None) -> List[Tuple[Document, float]]:
+        vector = self.embedding.embed_query(query)
+        return self.similarity_search_with_score_by_vector(vector, k, fetch_k)
+
+    def similarity_search_with_score_by_vector(self, vector: List[float], k: int = 4,
+                                               fetch_k: int = None) -> List[Tuple[Document, float]]:
+        with self._lock:
+            # Etwas mehr holen, damit gelöschte Einträge die Trefferzahl nicht schmälern
+            fetch = (fetch_k or k) + len(self._deleted) + self._main_dead
+            results = []
+            for store in (self.main, self.delta):
+                results.extend(r for r in _search(store, vector, fetch) if r[0].id not in self._deleted)
+        # FAISS liefert L2-Abstände: kleiner ist ähnlicher
+        results.sort(key=lambda item: item[1])
+        return results[:fetch_k or k]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return [doc for doc, _score in self.similarity_search_with_score(query, k)]
+
+    def filter_ids(self, topic: str = None, since: float = None, until: float = None,
+                   session: str = None) -> Optional[Set[str]]:
+        """Dokument-IDs, die zu Thema/Zeitraum/Sitzung passen (None, wenn nicht gefiltert wird)."""
+        if topic is None and since is None and until is None and session is None:
+            return None
+        with self._lock:
+            candidates = set(self._by_topic.get(topic, ())) if topic is not None else set(self.metadata)
+            if session is not None:
+                candidates &= self._by_session.get(session, set())
+            if since is None and until is None:
+                return candidates
+            allowed = set()
+            for doc_id in candidates:
+                timestamp = self.metadata[doc_id].get("timestamp")
+                if timestamp is None:
+                    continue
+                if (since is None or timestamp >= since) and (until is None or timestamp <= until):
+                    allowed.add(doc_id)
+            return allowed
+
+    def search_ids(self, query: str, k: int, allowed: Set[str] = None) -> List[Tuple[str, float]]:
+        """Genau k (doc_id, L2-Abstand)-Paare; `allowed` wird als FAISS-IDSelector vorgefiltert."""
+        return self.search_ids_by_vector(self.embedding.embed_query(query), k, allowed)
+
+    def search_ids_by_vector(self, vector: List[float], k: int, allowed: Set[str] = None) -> List[Tuple[str, float]]:
+        with self._lock:
+            results = []
+            for store, positions in ((self.main, self._main_positions), (self.delta, None)):
+                if allowed is not None:
+                    if positions is None:
+                        positions = {doc_id: i for i, doc_id in store.index_to_docstore_id.items()}
+                    internal = [positions[d] for d in allowed if d in positions]
+                    if not internal:
+                        continue
+                else:
+                    internal = None
+                results.extend(_search(store, vector, k + len(self._deleted) + self._main_dead, internal))
+            results = [(doc.id, score) for doc, score in results if doc.id not in self._deleted]
+        results.sort(key=lambda item: item[1])
+        return results[:k]
+
+    def lexical_search(self, query: str, k: int, allowed: Set[str] = None) -> List[Tuple[str, float]]:
+        """BM25-Treffer als (doc_id, Score); unter der Sperre, da der Worker den Index parallel ändert."""
+        with self._lock:
+            return self.lexical.search(query, k, allowed)
+
+    def metadata_of(self, doc_ids) -> Dict[str, dict]:
+        with self._lock:
+            return {doc_id: self.metadata.get(doc_id, {}) for doc_id in doc_ids}
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        with self._lock:
+            if doc_id in self._deleted:
+                return None
+            for store in (self.delta, self.main):
+                doc = store.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    return Document(page_content=doc.page_content, metadata=doc.metadata, id=doc_id)
+        return None
+
+    # Schreiben
+
+    def add_documents(self, docs: List[Document], dedupe: bool = True) -> List[str]:
+        if not docs:
+            return []
+        vectors = self.embedding.embed_documents([d.page_content for d in docs])
+        return self.add_embeddings(docs, vectors, dedupe)
+
+    def add_embeddings(self, docs: List[Document], vectors: List[List[float]], dedupe: bool = False) -> List[str]:
+        with self._lock:
+            if dedupe:
+                docs, vectors = self._suppress_duplicates(docs, vectors)
+            ids = [d.id or str(uuid.uuid4()) for d in docs]
+            records = []
+            for doc_id, doc, vector in zip(ids, docs, vectors):
+                self._seq += 1
+                records.append({
+                    "seq": self._seq,
+                    "op": "add",
+                    "id": doc_id,
+                    "text": doc.page_content,
+                    "metadata": doc.metadata,
+                    "vector": _encode(vector),
+                })
+            self._append(records)
+            self.delta.add_embeddings(
+                [(d.page_content, v) for d, v in zip(docs, vectors)],
+                metadatas=[d.metadata for d in docs],
+                ids=ids,
+            )
+            for doc_id, doc in zip(ids, docs):
+                self._index_doc(doc_id, doc)
+        return ids
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            records = []
+            for doc_id in ids:
+                self._seq += 1
+                records.append({"seq": self._seq, "op": "delete", "id": doc_id})
+                self._deleted.add(doc_id)
+                self._unindex_doc(doc_id)
+            self._append(records)
+
+    def maybe_checkpoint(self):
+        with self._lock:
+            # Beim Überschreiten der Größenschwelle sofort auf den ANN-Index umstellen
+            needs_ann = (self.index_type != "flat" and isinstance(self.main.index, _flat_types())
+                         and len(self) >= self.ann_threshold)
+            if needs_ann or self._seq - self._applied_seq >= self.checkpoint_every:
+                self.checkpoint()
+
+    def checkpoint(self):
+        """Übernimmt das Segment in einen neuen Hauptindex (atomarer Verzeichniswechsel)."""
+        with self._lock:
+            if self._seq == self._applied_seq:
+                return
+            # Beschreibbare Kopie des Hauptindex; die geladene ist per Memory-Mapping nur lesbar
+            full_main = self._load_main(self._main_dir, mmap=False) if self._main_dir is not None else self.main
+            delta = [(doc, vector) for doc, vector in _live_entries(self.delta) if doc.id not in self._deleted]
+            main_deleted = [doc_id for doc_id in self._deleted
+                            if isinstance(full_main.docstore.search(doc_id), Document)]
+            dead = self._main_dead + len(main_deleted)
+            if self._needs_rebuild(full_main.index, full_main.index.ntotal + len(delta) - dead, dead):
+                # HNSW kann nicht löschen: lebende Einträge einsammeln und neu aufbauen
+                docs, vectors = [], []
+                for doc, vector in _live_entries(full_main) + delta:
+                    if doc.id not in self._deleted:
+                        docs.append(doc)
+                        vectors.append(vector)
+                self._switch_main(self._build_store(docs, vectors))
+                return
+            # Anhängen: gelöschte Einträge bleiben im Index, verlieren aber ihren Docstore-Eintrag
+            # und werden bei der Suche übersprungen
+            if delta:
+                full_main.add_embeddings(
+                    [(d.page_content, v) for d, v in delta],
+                    metadatas=[d.metadata for d, _v in delta],
+                    ids=[d.id for d, _v in delta],
+                )
+            if main_deleted:
+                full_main.docstore.delete(main_deleted)
+            self._switch_main(full_main, dead)
+
+    def _needs_rebuild(self, index, live: int, dead: int) -> bool:
+        wanted = self.index_type if live >= self.ann_threshold else "flat"
+        # Kein Rückbau auf "flat", sonst pendelt der Index um die Schwelle
+        if wanted != "flat" and _index_kind(index) != wanted:
+            return True
+        return dead > TOMBSTONE_REBUILD_RATIO * max(1, live + dead)
+
+    def adopt(self, other: "SegmentedVectorStore"):
+        """Übernimmt den gesamten Inhalt eines anderen Stores, z. B. den Neuaufbau aus core.reindex.
+
+        Dessen Hauptindex wird als nächster main-<seq> hierher verschoben und über CURRENT
+        atomar aktiv; alle Segment-Einträge davor gelten damit als übernommen. `other`
+        muss auf demselben Dateisystem liegen und ist danach nicht mehr nutzbar.
+        """
+        other.checkpoint()
+        with self._lock:
+            self._seq += 1
+            new_dir = os.path.join(self.path, f"main-{self._seq:010d}")
+            if other._main_dir is not None and other._main_dir != other.path:
+                os.replace(other._main_dir, new_dir)
+            else:
+                other.main.save_local(new_dir)
+            self._install_main(new_dir, other._main_dead)
+            self.lexical = other.lexical
+            self.metadata = other.metadata
+            self._by_topic = other._by_topic
+            self._by_session = other._by_session
+        shutil.rmtree(other.path, ignore_errors=True)
+
+    def _switch_main(self, merged, dead: int = 0):
+        new_dir = os.path.join(self.path, f"main-{self._seq:010d}")
+        merged.save_local(new_dir)
+        self._install_main(new_dir, dead)
+
+    def _install_main(self, new_dir: str, dead: int):
+        self._write_current({"main": os.path.basename(new_dir), "applied_seq": self._seq, "dead": dead})
+
+        old_dir = self._main_dir
+        self._applied_seq = self._seq
+        self._main_dead = dead
+        self._deleted = set()
+        open(self._segment_path(), "w").close()
+        if old_dir == self.path:
+            # Altes Layout nach dem ersten Checkpoint aufräumen
+            for name in ("index.faiss", "index.pkl"):
+                os.remove(os.path.join(self.path, name))
+        elif old_dir and old_dir != new_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        self._main_dir = new_dir
+        self.main = self._load_main(new_dir)
+        self.delta = self._empty_store(self.main.index.d)
+        self._main_positions = {doc_id: i for i, doc_id in self.main.index_to_docstore_id.items()}
+
+    # Intern
+
+    def _load(self):
+        current = self._read_current()
+        if current:
+            self._main_dir = os.path.join(self.path, current["main"])
+            self._applied_seq = self._seq = current.get("applied_seq", 0)
+            self._main_dead = current.get("dead", 0)
+        elif os.path.exists(os.path.join(self.path, "index.faiss")):
+            # Altes Layout (FAISS.save_local direkt im Verzeichnis)
+            self._main_dir = self.path
+
+        if self._main_dir is not None:
+            self.main = self._load_main(self._main_dir)
+            dim = self.main.index.d
+        else:
+            dim = self._dim()
+            self.main = self._empty_store(dim)
+        self.delta = self._empty_store(dim)
+        self._main_positions = {doc_id: i for i, doc_id in self.main.index_to_docstore_id.items()}
+        for doc_id in self._main_positions:
+            doc = self.main.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                self._index_doc(doc_id, doc)
+        self._replay()
+
+    def _replay(self):
+        path = self._segment_path()
+        if not os.path.exists(path):
+            return
+        docs, vectors = [], []
+        good_end = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # halb geschriebener letzter Eintrag
+                good_end += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._seq = max(self._seq, record["seq"])
+                if record["seq"] <= self._applied_seq:
+                    continue
+                if record["op"] == "add":
+                    docs.append(Document(page_content=record["text"], metadata=record["metadata"], id=record["id"]))
+                    vectors.append(_decode(record["vector"]))
+                elif record["op"] == "delete":
+                    self._deleted.add(record["id"])
+                    self._unindex_doc(record["id"])
+        if good_end < os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(good_end)
+        if docs:
+            self.delta.add_embeddings(
+                [(d.page_content, v) for d, v in zip(docs, vectors)],
+                metadatas=[d.metadata for d in docs],
+                ids=[d.id for d in docs],
+            )
+            for doc in docs:
+                if doc.id not in self._deleted:
+                    self._index_doc(doc.id, doc)
+
+    def _load_main(self, folder: str, mmap: bool = True):
+        import faiss
+        from langchain_community.vectorstores import FAISS
+        index_path = os.path.join(folder, "index.faiss")
+        index = None
+        if mmap:
+            try:
+                # Memory-Mapping: der Index wird nicht komplett in den RAM gelesen
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                pass
+        if index is None:
+            index = faiss.read_index(index_path)
+        _tune(index)
+        with open(os.path.join(folder, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(
+            embedding_function=self.embedding,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+
+    def _index_doc(self, doc_id: str, doc: Document):
+        self.lexical.add(doc_id, f"{doc.metadata.get('title', '')} {doc.page_content}")
+        self.metadata[doc_id] = doc.metadata
+        self._by_topic[doc.metadata.get("topic")].add(doc_id)
+        self._by_session[doc.metadata.get("session")].add(doc_id)
+
+    def _unindex_doc(self, doc_id: str):
+        self.lexical.remove(doc_id)
+        metadata = self.metadata.pop(doc_id, None)
+        if metadata is not None:
+            self._by_topic[metadata.get("topic")].discard(doc_id)
+            self._by_session[metadata.get("session")].discard(doc_id)
+
+    def _build_store(self, docs: List[Document], vectors: List[np.ndarray]):
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+        dim = self._dim()
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), dim)
+        index = build_index(matrix, self.index_type if len(docs) >= self.ann_threshold else "flat")
+        return FAISS(
+            embedding_function=self.embedding,
+            index=index,
+            docstore=InMemoryDocstore({d.id: d for d in docs}),
+            index_to_docstore_id={i: d.id for i, d in enumerate(docs)},
+        )
+
+    def _suppress_duplicates(self, docs: List[Document], vectors: List[List[float]]):
+        # Annahme: normierte Embeddings (MiniLM), dann gilt cos = 1 - L2² / 2
+        # Zusammengeführt wird nur innerhalb derselben Sitzung
+        kept_docs, kept_vectors, replaced = [], [], []
+        for doc, vector in zip(docs, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            session = doc.metadata.get("session")
+            same_batch = next((i for i, other in enumerate(kept_vectors)
+                               if kept_docs[i].metadata.get("session") == session
+                               and _cosine(vector, other) >= self.duplicate_similarity), None)
+            if same_batch is not None:
+                kept_docs[same_batch] = _merge_episode(kept_docs[same_batch], doc)
+                kept_vectors[same_batch] = vector
+                continue
+            hits = self.search_ids_by_vector(vector.tolist(), 1, self._by_session.get(session, set()))
+            old = self.get_document(hits[0][0]) if hits and 1 - hits[0][1] / 2 >= self.duplicate_similarity else None
+            if old is not None:
+                replaced.append(old.id)
+                doc = _merge_episode(old, doc)
+            kept_docs.append(doc)
+            kept_vectors.append(vector)
+        if replaced:
+            self.delete(replaced)
+        return kept_docs, [v.tolist() for v in kept_vectors]
+
+    def _empty_store(self, dim: int):
+        import faiss
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+        return FAISS(
+            embedding_function=self.embedding,
+            index=faiss.IndexFlatL2(dim),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+        )
+
+    def _dim(self) -> int:
+        if self.main is not None:
+            return self.main.index.d
+        return len(self.embedding.embed_query("dimension probe"))
+
+    def _append(self, records: List[dict]):
+        with open(self._segment_path(), "ab") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _segment_path(self) -> str:
+        return os.path.join(self.path, "segment.log")
+
+    def _read_current(self):
+        path = os.path.join(self.path, "CURRENT")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_current(self, data: dict):
+        path = os.path.join(self.path, "CURRENT")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+def build_index(vectors: np.ndarray, index_type: str):
+    """Erzeugt (und trainiert ggf.) einen FAISS-Index des gewünschten Typs."""
+    import faiss
+    n, dim = vectors.shape
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == "ivf":
+        nlist = max(1, min(n // 39, int(IVF_NLIST_FACTOR * math.sqrt(n))))
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        index.train(vectors)
+    else:
+        index = faiss.IndexFlatL2(dim)
+    if n:
+        index.add(vectors)
+    _tune(index)
+    return index
+
+
+def _tune(index):
+    # Suchparameter werden nicht (zuverlässig) mitgespeichert
+    import faiss
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+
+
+def _search_params(index, internal_ids: np.ndarray):
+    # Vorfilter: FAISS betrachtet nur die erlaubten internen IDs
+    import faiss
+    selector = faiss.IDSelectorBatch(internal_ids)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def _flat_types():
+    import faiss
+    return (faiss.IndexFlat,)
+
+
+def _index_kind(index) -> str:
+    import faiss
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def _live_entries(store):
+    import faiss
+    index = store.index
+    if not index.ntotal:
+        return []
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    vectors = index.reconstruct_n(0, index.ntotal)
+    entries = []
+    for i, vector in enumerate(vectors):
+        doc_id = store.index_to_docstore_id.get(i)
+        doc = store.docstore.search(doc_id) if doc_id is not None else None
+        if isinstance(doc, Document):
+            if doc.id != doc_id:
+                doc = Document(page_content=doc.page_content, metadata=doc.metadata, id=doc_id)
+            entries.append((doc, vector))
+    return entries
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> float:
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b)) / denom if denom else 0.0
+
+
+def _merge_episode(old: Document, new: Document) -> Document:
+    # Die neuere Zusammenfassung ersetzt die alte; Herkunft wird mitgezählt
+    if old.metadata.get("session") != new.metadata.get("session"):
+        raise ValueError("Episoden verschiedener Sitzungen werden nicht zusammengeführt")
+    metadata = {**old.metadata, **new.metadata, "merged": old.metadata.get("merged", 1) + 1}
+    if "first_seen" in old.metadata:
+        metadata["first_seen"] = old.metadata["first_seen"]
+    return Document(page_content=new.page_content, metadata=metadata, id=new.id)
+
+
+def _search(store, vector, k: int, internal_ids: List[int] = None) -> List[Tuple[Document, float]]:
+    # Direkt auf dem FAISS-Index suchen, damit jedes Ergebnis seine Docstore-ID trägt
+    if not store.index.ntotal:
+        return []
+    query = np.asarray([vector], dtype=np.float32)
+    if internal_ids is None:
+        scores, indices = store.index.search(query, min(k, store.index.ntotal))
+    else:
+        params = _search_params(store.index, np.asarray(internal_ids, dtype=np.int64))
+        scores, indices = store.index.search(query, min(k, len(internal_ids)), params=params)
+    results = []
+    for i, score in zip(indices[0], scores[0]):
+        if i == -1:
+            continue
+        doc_id = store.index_to_docstore_id[int(i)]
+        doc = store.docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            continue
+        if doc.id != doc_id:
+            doc = Document(page_content=doc.page_content, metadata=doc.metadata, id=doc_id)
+        results.append((doc, float(score)))
+    return results
+
+
+def _encode(vector) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode(data: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).tolist()